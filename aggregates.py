@@ -0,0 +1,210 @@
+"""Precomputed aggregates for the bar chart branches of app.py.
+
+``build_aggregates`` makes one pass over the cleaned frame and keeps additive
+measures (row counts, price/days_listed counts and sums) per
+(make, condition, fuel, model_year_range) combination. Chart branches then roll
+that table up to the keys they need, which costs O(groups) instead of O(rows).
+Medians are not additive, so they are precomputed for the groupings the charts use.
+With the sketch quantile engine (see sketches.py) the store also keeps a
+mergeable sketch per median group, and appended rows update the medians from
+those sketches without rescanning the frame.
+
+A store can also live in another execution backend (see backends.py);
+``rollup`` and ``median`` hand such stores over to it.
+"""
+
+import pandas as pd
+
+from diagnostics import span, timed_import
+from features import TIME_BUCKETS, add_time_buckets, ordered_buckets
+from sketches import build_sketches, merge_sketches, sketch_quantile, use_sketches
+
+# Finest grain of the aggregate table
+CUBE_KEYS = ["make", "condition", "fuel", "model_year_range"]
+
+# Additive measures kept per cube cell: name -> (source column, aggregation)
+MEASURES = {
+    "rows": ("price", "size"),
+    "price_count": ("price", "count"),
+    "price_sum": ("price", "sum"),
+    "days_listed_count": ("days_listed", "count"),
+    "days_listed_sum": ("days_listed", "sum"),
+}
+
+# Groupings whose median price is precomputed
+MEDIAN_GROUPINGS = [("model_year_range", "make")]
+
+
+def add_decade_range(df):
+    """Return ``df`` with the ordered ``model_year_range`` decade column.
+
+    Cleaned frames already carry it (see features.py); this covers other frames.
+    """
+    if "model_year_range" in df.columns:
+        return df
+    return add_time_buckets(df, {"model_year_range": TIME_BUCKETS["model_year_range"]})
+
+
+def _median_table(df, grouping):
+    return (
+        df.groupby(list(grouping), observed=True)["price"]
+        .median()
+        .reset_index()
+        .rename(columns={"price": "price_median"})
+    )
+
+
+def _sketch_median_table(sketches, grouping):
+    table = sketch_quantile(sketches, grouping, 0.5).rename(columns={"value": "price_median"})
+    table = table.astype({key: object for key in grouping})
+    return _restore_key_dtypes(table).sort_values(list(grouping)).reset_index(drop=True)
+
+
+def build_aggregates(df, medians=True, engine=None):
+    """Build the aggregate store for a cleaned listings frame.
+
+    ``medians=False`` skips the median tables (used for the partial stores that
+    ``update_aggregates`` merges in). ``engine`` picks the quantile engine for
+    the medians (default: ``sketches.QUANTILE_ENGINE``).
+    """
+    df = add_decade_range(df)
+
+    keys = [key for key in CUBE_KEYS if key in df.columns]
+    measures = {
+        name: spec for name, spec in MEASURES.items() if spec[0] in df.columns
+    }
+
+    # Keep missing keys as their own cells, so roll-ups over other keys still count those rows
+    with span("aggregates:cube"):
+        base = df.groupby(keys, dropna=False, observed=True).agg(**measures).reset_index()
+
+    median_tables = {}
+    sketches = {}
+    for grouping in MEDIAN_GROUPINGS if medians else []:
+        if all(key in df.columns for key in grouping) and "price" in df.columns:
+            with span("aggregates:medians"):
+                if use_sketches(engine):
+                    sketches[grouping] = build_sketches(df, grouping, "price")
+                    median_tables[grouping] = _sketch_median_table(sketches[grouping], grouping)
+                else:
+                    median_tables[grouping] = _median_table(df, grouping)
+
+    store = {"keys": keys, "base": base, "medians": median_tables}
+    if sketches:
+        store["sketches"] = sketches
+    return store
+
+
+def _restore_key_dtypes(table):
+    for key in table.columns.intersection(CUBE_KEYS):
+        if key == "model_year_range":
+            table[key] = ordered_buckets(table[key])
+        else:
+            table[key] = table[key].astype("category")
+    return table
+
+
+def update_aggregates(store, df, added=None, removed=None):
+    """Return ``store`` updated for rows ``added`` to and ``removed`` from the data.
+
+    The additive measures are merged as partial aggregates, so their cost follows
+    the size of the change. ``df`` is the full frame after the change; only the
+    median groups touched by the change are recomputed from it. A store with
+    sketches merges the sketches of ``added`` instead, as long as nothing was
+    removed (a sketch cannot subtract values).
+    """
+    keys = store["keys"]
+    measures = [column for column in store["base"].columns if column not in keys]
+
+    parts = [store["base"]]
+    changes = []
+    for rows, sign in ((added, 1), (removed, -1)):
+        if rows is None or len(rows) == 0:
+            continue
+        rows = add_decade_range(rows)
+        changes.append(rows)
+        partial = build_aggregates(rows, medians=False)["base"]
+        partial[measures] = partial[measures] * sign
+        parts.append(partial)
+
+    if not changes:
+        return store
+
+    base = (
+        pd.concat(parts, ignore_index=True)
+        .groupby(keys, dropna=False, observed=True)[measures]
+        .sum()
+        .reset_index()
+    )
+    base = _restore_key_dtypes(base[base["rows"] > 0].reset_index(drop=True))
+
+    median_tables = {}
+    sketches = {}
+    for grouping, table in store["medians"].items():
+        if grouping in store.get("sketches", {}):
+            if removed is None or len(removed) == 0:
+                rows = add_decade_range(added)
+                sketches[grouping] = merge_sketches(
+                    [store["sketches"][grouping], build_sketches(rows, grouping, "price")], grouping
+                )
+            else:
+                sketches[grouping] = build_sketches(add_decade_range(df), grouping, "price")
+            median_tables[grouping] = _sketch_median_table(sketches[grouping], grouping)
+            continue
+
+        grouping = list(grouping)
+        touched = pd.MultiIndex.from_frame(
+            pd.concat([rows[grouping].astype(object) for rows in changes]).drop_duplicates()
+        )
+        frame = add_decade_range(df)
+        in_touched = pd.MultiIndex.from_frame(frame[grouping].astype(object)).isin(touched)
+        recomputed = _median_table(frame[in_touched], grouping)
+        untouched = table[~pd.MultiIndex.from_frame(table[grouping].astype(object)).isin(touched)]
+        merged = pd.concat([untouched.astype({key: object for key in grouping}),
+                            recomputed.astype({key: object for key in grouping})], ignore_index=True)
+        merged = _restore_key_dtypes(merged).sort_values(grouping).reset_index(drop=True)
+        median_tables[tuple(grouping)] = merged
+
+    store = {"keys": keys, "base": base, "medians": median_tables}
+    if sketches:
+        store["sketches"] = sketches
+    return store
+
+
+def rollup(store, by, measures=("rows", "price_count", "price_sum")):
+    """Aggregate the store up to the ``by`` keys.
+
+    Any ``<column>_mean`` in ``measures`` is derived from the matching sum and
+    count. Rows whose ``by`` keys are missing are dropped, like a plain groupby.
+    """
+    if "backend" in store:
+        return timed_import("backends").rollup(store, by, measures)
+
+    additive = set()
+    for measure in measures:
+        if measure.endswith("_mean"):
+            column = measure[: -len("_mean")]
+            additive.update([f"{column}_sum", f"{column}_count"])
+        else:
+            additive.add(measure)
+    additive = [measure for measure in MEASURES if measure in additive]
+
+    table = (
+        store["base"]
+        .groupby(list(by), observed=True)[additive]
+        .sum()
+        .reset_index()
+    )
+    for measure in measures:
+        if measure.endswith("_mean"):
+            column = measure[: -len("_mean")]
+            table[measure] = table[f"{column}_sum"] / table[f"{column}_count"]
+
+    return table[list(by) + list(measures)]
+
+
+def median(store, by):
+    """Return the precomputed median price for the ``by`` grouping."""
+    if "backend" in store:
+        return timed_import("backends").median(store, by)
+    return store["medians"][tuple(by)].copy()
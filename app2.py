@@ -1,10 +1,18 @@
 import streamlit as st
-import pandas as pd
 import plotly.express as px
 
+from charts import bar_totals, box_figure, box_stats, histogram_counts, histogram_figure
+from computed_columns import ComputedColumns, ExpressionError
+from diagnostics import diagnostics_panel, finish_rerun, record_miss, span, start_rerun
+from filters import build_index, filter_key, filter_rows, filter_sidebar
+from upload_cache import UploadCache
+
 # Set page configuration
 st.set_page_config(page_title="Interactive Data Visualization App", layout="wide")
 
+# Opt-in per-rerun profiling (?diagnostics=1 or APP_DIAGNOSTICS=1)
+profiler = start_rerun("app2", st.query_params)
+
 # Header and Introduction
 st.header("Interactive Data Visualization with Streamlit")
 st.markdown("""
@@ -15,15 +23,81 @@ This application allows you to:
 - Visualize data interactively using various Plotly charts.
 """)
 
+# Parsed uploads shared by every session, keyed on the file's content hash
+@st.cache_resource
+def get_upload_cache():
+    return UploadCache()
+
+# Bitmap / sorted indexes behind the sidebar filters, built once per upload
+@st.cache_data(show_spinner="Indexing dataset...")
+def get_filter_index(_df, content_hash, categorical_columns, range_columns):
+    record_miss("get_filter_index")
+    return build_index(_df, categorical_columns, range_columns)
+
+# Histogram bar heights, cached per (column, bin spec, dataset version)
+@st.cache_data(max_entries=64)
+def get_histogram_counts(_df, dataset_version, column, bins):
+    record_miss("get_histogram_counts")
+    return histogram_counts(_df, column, bins=bins)
+
+# Box plot statistics, cached per (y column, x column, dataset version)
+@st.cache_data(max_entries=64)
+def get_box_stats(_df, dataset_version, y_axis, x_axis):
+    record_miss("get_box_stats")
+    return box_stats(_df, y_axis, x_axis)
+
+# Bar heights per x value, cached like the box statistics
+@st.cache_data(max_entries=64)
+def get_bar_totals(_df, dataset_version, x_axis, y_axis, statistic):
+    record_miss("get_bar_totals")
+    return bar_totals(_df, x_axis, y_axis, statistic)
+
 # File uploader
 uploaded_file = st.file_uploader("Upload your dataset (CSV)", type=["csv"])
 
 if uploaded_file:
-    # Load dataset
-    df = pd.read_csv(uploaded_file)
+    # Load dataset. Identical uploads (from any session) are parsed only once;
+    # new ones are streamed into the on-disk columnar store block by block.
+    # The file is hashed once per session and the progress bar only appears while parsing.
+    progress_bar = st.empty()
+    with span("upload", cache="upload_cache"):
+        df, content_hash = get_upload_cache().get(
+            uploaded_file,
+            progress=lambda fraction: progress_bar.progress(fraction, text="Reading CSV..."),
+            known_hashes=st.session_state.setdefault("upload_hashes", {}),
+        )
+    progress_bar.empty()
     st.write("### Dataset Preview")
     st.write(df.head())
 
+    # Columns the dataset itself has; the filters index these
+    base_numeric_columns = df.select_dtypes(include=["float64", "int64"]).columns.tolist()
+    base_categorical_columns = df.select_dtypes(include=["object", "category"]).columns.tolist()
+
+    # Computed columns of this session, e.g. "price / odometer" or "date_posted + days_listed".
+    # Results are cached per upload; editing a column recomputes only it and its dependents.
+    computed = st.session_state.setdefault("computed_columns", ComputedColumns())
+    computed_expander = st.expander("Add computed columns", expanded=bool(computed.columns))
+    with computed_expander.form("computed_column", clear_on_submit=True):
+        name = st.text_input("Column name", placeholder="price_per_mile")
+        expression = st.text_input("Expression", placeholder="price / odometer")
+        if st.form_submit_button("Add column"):
+            try:
+                computed.define(name, expression, df.columns)
+            except ExpressionError as exc:
+                st.error(str(exc))
+    with span("computed_columns"):
+        df, recomputed = computed.apply(df, content_hash)
+    for column_name in computed.order():
+        text, remove = computed_expander.columns([5, 1])
+        text.markdown(f"**{column_name}** = `{computed.columns[column_name].expression}`")
+        if column_name in computed.errors:
+            text.error(computed.errors[column_name])
+        remove.button("Remove", key=f"remove_{column_name}", on_click=computed.remove, args=(column_name,),
+                      help="Also removes the computed columns that use this one")
+    if recomputed:
+        computed_expander.caption(f"Computed: {', '.join(recomputed)}")
+
     # Sidebar menu for visualizations
     st.sidebar.header("Visualization Menu")
     chart_selection = st.sidebar.selectbox(
@@ -31,36 +105,83 @@ if uploaded_file:
         ["Histogram", "Scatter Plot", "Bar Chart", "Boxplot"]
     )
 
+    # Chart selectors offer the computed columns too
     numeric_columns = df.select_dtypes(include=["float64", "int64"]).columns.tolist()
     categorical_columns = df.select_dtypes(include=["object", "category"]).columns.tolist()
 
+    # Sidebar filters, resolved against indexes built once per upload
+    st.sidebar.header("Filters")
+    with span("get_filter_index", cache="get_filter_index"):
+        filter_index = get_filter_index(
+            df, content_hash, tuple(base_categorical_columns), tuple(base_numeric_columns)
+        )
+    selections, ranges = filter_sidebar(st.sidebar, filter_index, base_categorical_columns, base_numeric_columns)
+    with span("filter_rows"):
+        rows = filter_rows(filter_index, selections, ranges)
+        if rows is not None:
+            df = df.take(rows)
+    if rows is not None:
+        st.sidebar.caption(f"{len(df):,} of {filter_index['n_rows']:,} rows match the filters.")
+
+    # Version of the charted data: the upload, the active filters and the computed columns' definitions
+    dataset_version = (
+        content_hash,
+        filter_key(selections, ranges) if rows is not None else None,
+        tuple((name, computed.signature(name)) for name in computed.order()),
+    )
+
     # Display selected chart
     if chart_selection == "Histogram":
         st.write("### Histogram")
         column = st.selectbox("Select a column for the histogram", numeric_columns)
-        hist_chart = px.histogram(df, x=column, nbins=20, title=f"Histogram of {column}")
-        st.plotly_chart(hist_chart)
+        # Bin on the server so only the bar heights are sent to the browser
+        with span("get_histogram_counts", cache="get_histogram_counts"):
+            counts = get_histogram_counts(df, dataset_version, column, 20)
+        with span("chart.build"):
+            hist_chart = histogram_figure(counts, column, title=f"Histogram of {column}")
+        with span("display"):
+            st.plotly_chart(hist_chart)
 
     elif chart_selection == "Scatter Plot":
         st.write("### Scatter Plot")
         x_axis = st.selectbox("Select X-axis", numeric_columns, key="scatter_x")
         y_axis = st.selectbox("Select Y-axis", numeric_columns, key="scatter_y")
-        scatter_chart = px.scatter(df, x=x_axis, y=y_axis, title=f"Scatter Plot: {x_axis} vs {y_axis}")
-        st.plotly_chart(scatter_chart)
+        with span("chart.build"):
+            scatter_chart = px.scatter(df, x=x_axis, y=y_axis, title=f"Scatter Plot: {x_axis} vs {y_axis}")
+        with span("display"):
+            st.plotly_chart(scatter_chart)
 
     elif chart_selection == "Bar Chart":
         st.write("### Bar Chart")
         x_axis = st.selectbox("Select X-axis", categorical_columns + numeric_columns, key="bar_x")
         y_axis = st.selectbox("Select Y-axis", numeric_columns, key="bar_y")
-        bar_chart = px.bar(df, x=x_axis, y=y_axis, title=f"Bar Chart: {x_axis} vs {y_axis}")
-        st.plotly_chart(bar_chart)
+        statistic = st.selectbox("Aggregate", ["sum", "mean", "median", "count"], key="bar_statistic")
+        # One bar per x value (a sum matches the heights of the stacked per-row bars)
+        with span("get_bar_totals", cache="get_bar_totals"):
+            totals = get_bar_totals(df, dataset_version, x_axis, y_axis, statistic)
+        with span("chart.build"):
+            # The value column is renamed when X and Y are the same column
+            value_column = totals.columns[1]
+            bar_chart = px.bar(
+                totals, x=x_axis, y=value_column, title=f"Bar Chart: {statistic} of {y_axis} by {x_axis}",
+                labels={value_column: f"{y_axis} ({statistic})"},
+            )
+        with span("display"):
+            st.plotly_chart(bar_chart)
 
     elif chart_selection == "Boxplot":
         st.write("### Boxplot")
         y_axis = st.selectbox("Select Y-axis", numeric_columns, key="box_y")
         x_axis = st.selectbox("Select X-axis (Optional)", categorical_columns + [None], key="box_x")
-        box_chart = px.box(df, y=y_axis, x=x_axis, title=f"Box Plot of {y_axis} by {x_axis}")
-        st.plotly_chart(box_chart)
+        # Quartiles, whiskers and a capped outlier sample per group, computed on the server
+        with span("get_box_stats", cache="get_box_stats"):
+            stats, outliers = get_box_stats(df, dataset_version, y_axis, x_axis)
+        with span("chart.build"):
+            box_chart = box_figure(stats, outliers, y_axis, x_axis, title=f"Box Plot of {y_axis} by {x_axis}")
+        if stats["outliers"].sum() > len(outliers):
+            st.caption(f"Showing {len(outliers):,} of {int(stats['outliers'].sum()):,} outliers.")
+        with span("display"):
+            st.plotly_chart(box_chart)
 
 
     
@@ -73,3 +194,7 @@ if uploaded_file:
         st.write("### Raw Dataset")
     
 
+# Per-rerun waterfall and cache counters (diagnostics mode only)
+if profiler is not None:
+    diagnostics_panel(st.sidebar.expander("Rerun profile", expanded=True), profiler)
+finish_rerun()
@@ -0,0 +1,140 @@
+"""Execution backends for the aggregate queries behind the bar charts.
+
+The chart registry asks the aggregate store for roll-ups and medians
+(``aggregates.rollup`` / ``aggregates.median``). With the default ``pandas``
+backend the store holds in-memory tables built by ``build_aggregates``. With
+``QUERY_BACKEND=duckdb`` the store only points at the Parquet snapshot of the
+cleaned frame: each roll-up compiles to one SQL ``GROUP BY`` that DuckDB runs
+over the file, multi-threaded and out of core, so the aggregate charts no longer
+need the pandas cube.
+
+Results come back with the same columns, key dtypes and row order as the pandas
+backend. The row-level charts (scatter plots, histograms) and filtered views
+still use the in-memory frame. ``duckdb`` is an optional dependency, only
+imported when the backend is selected.
+"""
+
+import os
+import threading
+
+from aggregates import CUBE_KEYS, MEASURES, build_aggregates
+from data_cache import read_meta, snapshot_path
+from diagnostics import span, timed_import
+from incremental import load_aggregates
+from preprocessing import clean_snapshot_name, pipeline_key
+
+# "pandas" (in-memory aggregate tables) or "duckdb" (SQL over the Parquet snapshot)
+QUERY_BACKEND = os.environ.get("QUERY_BACKEND", "pandas")
+
+BACKENDS = ("pandas", "duckdb")
+
+# One DuckDB connection per thread (Streamlit runs each session on its own thread)
+_local = threading.local()
+
+
+def aggregate_store(df, data_hash, backend=None, source="snapshot"):
+    """Aggregate store for the cleaned frame ``df`` of dataset ``data_hash``.
+
+    ``source`` is the one ``df`` was cleaned for (see ``preprocessing.load_clean_data``).
+
+    Falls back to the pandas store when the DuckDB backend is selected but the
+    cleaned snapshot on disk is not the one for ``data_hash``.
+    """
+    backend = backend or QUERY_BACKEND
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown query backend {backend!r}, expected one of {', '.join(BACKENDS)}")
+
+    name = clean_snapshot_name(source)
+    key = pipeline_key(data_hash) if data_hash is not None else None
+    if backend == "duckdb" and key is not None:
+        store = sql_store(name, key, df)
+        if store is not None:
+            return store
+
+    store = load_aggregates(name, key) if key is not None else None
+    return store if store is not None else build_aggregates(df)
+
+
+def sql_store(name, key, df):
+    """Store that runs its queries on the snapshot ``name``, if it was stored for ``key``.
+
+    ``df`` (or just its dtypes) gives the key dtypes the results are cast back to.
+    """
+    if (read_meta(name) or {}).get("key") != key:
+        return None
+    dtypes = {column: df[column].dtype for column in df.columns}
+    return {
+        "backend": "duckdb",
+        "source": snapshot_path(name),
+        "keys": [key for key in CUBE_KEYS if key in dtypes],
+        "dtypes": dtypes,
+    }
+
+
+def _connection():
+    connection = getattr(_local, "connection", None)
+    if connection is None:
+        duckdb = timed_import("duckdb")
+        connection = _local.connection = duckdb.connect()
+    return connection
+
+
+def _quote(identifier):
+    return '"' + identifier.replace('"', '""') + '"'
+
+
+def _source(path):
+    return "read_parquet('" + path.replace("'", "''") + "')"
+
+
+def _measure_sql(measure):
+    """SQL expression of a ``rollup`` measure (see ``aggregates.MEASURES``)."""
+    if measure.endswith("_mean"):
+        column = _quote(measure[: -len("_mean")])
+        # sum / count like the pandas roll-up; NULL (NaN) for groups without values
+        return f"SUM({column})::DOUBLE / NULLIF(COUNT({column}), 0)"
+    column, aggregation = MEASURES[measure]
+    if aggregation == "size":
+        return "COUNT(*)"
+    if aggregation == "count":
+        return f"COUNT({_quote(column)})"
+    # A group with no values sums to 0, like the pandas cube
+    return f"COALESCE(SUM({_quote(column)}), 0)"
+
+
+def compile_rollup(source, by, measures):
+    """SQL for ``rollup(store, by, measures)`` over the Parquet file ``source``."""
+    keys = ", ".join(_quote(key) for key in by)
+    selected = ", ".join(f"{_measure_sql(measure)} AS {_quote(measure)}" for measure in measures)
+    # Rows with a missing key are dropped, like a plain groupby
+    where = " AND ".join(f"{_quote(key)} IS NOT NULL" for key in by)
+    return f"SELECT {keys}, {selected} FROM {_source(source)} WHERE {where} GROUP BY {keys}"
+
+
+def compile_median(source, by, column="price"):
+    """SQL for the median of ``column`` per ``by`` group (``aggregates.median``)."""
+    keys = ", ".join(_quote(key) for key in by)
+    where = " AND ".join(f"{_quote(key)} IS NOT NULL" for key in list(by) + [column])
+    return (
+        f"SELECT {keys}, MEDIAN({_quote(column)})::DOUBLE AS {_quote(column + '_median')} "
+        f"FROM {_source(source)} WHERE {where} GROUP BY {keys}"
+    )
+
+
+def _query(store, sql, by):
+    with span("sql_query"):
+        table = _connection().execute(sql).df()
+    # Cast the keys back to the frame's dtypes, so sorting follows the category order
+    for key in by:
+        table[key] = table[key].astype(store["dtypes"][key])
+    return table.sort_values(list(by)).reset_index(drop=True)
+
+
+def rollup(store, by, measures):
+    """``aggregates.rollup`` for a DuckDB store."""
+    return _query(store, compile_rollup(store["source"], by, measures), by)
+
+
+def median(store, by):
+    """``aggregates.median`` for a DuckDB store."""
+    return _query(store, compile_median(store["source"], by), by)
@@ -0,0 +1,365 @@
+"""Headless benchmarks for the data pipeline and every chart of app.py.
+
+Generates synthetic ``vehicles_us``-shaped datasets, then times CSV ingestion,
+each preprocessing step and each chart in the registry (figure construction and
+JSON/PNG serialization), outside the Streamlit server. Every stage records wall
+time (best of ``--repeat`` runs), peak Python-level memory (tracemalloc, in a
+separate run so tracing does not slow the timed runs) and payload bytes.
+
+Results are compared against a stored baseline, and regressions make the script
+exit with status 1. So does a ``preprocess:clean_data`` peak above
+``--memory-budget`` times the raw frame's size (the ``ingest`` payload):
+
+    python benchmark.py --rows 50000 500000            # compare with the baseline
+    python benchmark.py --rows 50000 --save-baseline   # record a new baseline
+    python benchmark.py --rows 50000 --charts price_histogram sales_by_make
+"""
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pacsv
+
+# Keep benchmark snapshots out of the app's cache directory (read at import time)
+WORK_DIR = tempfile.mkdtemp(prefix="vehicles-bench-")
+os.environ["SNAPSHOT_DIR"] = WORK_DIR
+
+from aggregates import build_aggregates  # noqa: E402
+from chart_registry import CHARTS, CHARTS_BY_ID, render  # noqa: E402
+from charts import SCATTER_MAX_POINTS  # noqa: E402
+from features import add_time_buckets  # noqa: E402
+from imputation import DEFAULT_RULES, impute  # noqa: E402
+from ingest import ingest_csv, read_ingested  # noqa: E402
+from model_names import parse_models  # noqa: E402
+from preprocessing import clean_data, parse_dates, pipeline_key  # noqa: E402
+from schema import apply_schema  # noqa: E402
+
+DEFAULT_ROWS = [50_000, 500_000, 5_000_000]
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmark_baseline.json")
+
+# A stage regresses when it is this much slower / larger than the baseline ...
+TOLERANCE = 0.2
+# ... and the difference is above the noise floor
+MIN_SECONDS = 0.02
+MIN_PEAK_MB = 1.0
+
+# Peak memory allowed for preprocess:clean_data, as a multiple of the raw frame's size
+MEMORY_BUDGET = 1.0
+
+# Value distributions of the synthetic listings, roughly those of vehicles_us.csv
+MODELS = [
+    "ford f-150", "chevrolet silverado 1500", "ram 1500", "chevrolet silverado", "jeep wrangler",
+    "ford escape", "toyota camry", "honda accord", "toyota tacoma", "nissan altima",
+    "honda civic", "ford explorer", "jeep grand cherokee", "toyota corolla", "chevrolet malibu",
+    "ford f-250 sd", "chevrolet tahoe", "gmc sierra 1500", "toyota rav4", "subaru outback",
+    "hyundai sonata", "dodge grand caravan", "nissan rogue", "bmw x5", "kia sorento",
+    "volkswagen jetta", "chrysler 300", "mercedes-benz benze sprinter 2500", "acura tl",
+    "cadillac escalade", "buick enclave", "chevy malibu", "ford mustang", "honda odyssey",
+]
+CONDITIONS = (["excellent", "good", "like new", "fair", "new", "salvage"],
+              [0.48, 0.39, 0.09, 0.03, 0.005, 0.005])
+CYLINDERS = ([4, 6, 8, 3, 5, 10, 12], [0.30, 0.31, 0.34, 0.01, 0.01, 0.02, 0.01])
+FUELS = (["gas", "diesel", "hybrid", "other", "electric"], [0.92, 0.07, 0.006, 0.003, 0.001])
+TRANSMISSIONS = (["automatic", "manual", "other"], [0.91, 0.055, 0.035])
+TYPES = (["SUV", "truck", "sedan", "pickup", "coupe", "wagon", "mini-van", "hatchback",
+          "van", "convertible", "other", "offroad", "bus"],
+         [0.24, 0.24, 0.24, 0.13, 0.04, 0.03, 0.02, 0.02, 0.012, 0.008, 0.005, 0.004, 0.001])
+PAINT_COLORS = (["white", "black", "silver", "grey", "blue", "red", "green", "brown",
+                 "custom", "yellow", "orange", "purple"],
+                [0.24, 0.19, 0.15, 0.12, 0.10, 0.10, 0.03, 0.03, 0.02, 0.01, 0.007, 0.003])
+
+
+def _choice(rng, values_and_weights, n_rows):
+    values, weights = values_and_weights
+    weights = np.asarray(weights) / np.sum(weights)
+    return np.asarray(values).take(rng.choice(len(values), size=n_rows, p=weights))
+
+
+def _with_missing(rng, values, fraction):
+    values = values.astype("float64") if values.dtype.kind in "iu" else values.astype(object)
+    values[rng.random(len(values)) < fraction] = np.nan if values.dtype.kind == "f" else None
+    return values
+
+
+def synthetic_vehicles(n_rows, seed=0):
+    """A raw listings frame with the columns, dtypes and missing values of vehicles_us.csv."""
+    rng = np.random.default_rng(seed)
+    dates = pd.date_range("2018-05-01", "2019-04-19").strftime("%Y-%m-%d").to_numpy()
+    model_year = 2019 - np.minimum(rng.gamma(2.0, 4.0, n_rows).astype("int64"), 111)
+    return pd.DataFrame({
+        "price": np.clip(rng.lognormal(9.0, 0.9, n_rows), 1, 375_000).astype("int64"),
+        "model_year": _with_missing(rng, model_year, 0.07),
+        "model": rng.choice(MODELS, n_rows),
+        "condition": _choice(rng, CONDITIONS, n_rows),
+        "cylinders": _with_missing(rng, _choice(rng, CYLINDERS, n_rows), 0.10),
+        "fuel": _choice(rng, FUELS, n_rows),
+        "odometer": _with_missing(rng, np.round(rng.gamma(3.0, 38_000, n_rows)), 0.15),
+        "transmission": _choice(rng, TRANSMISSIONS, n_rows),
+        "type": _choice(rng, TYPES, n_rows),
+        "paint_color": _with_missing(rng, _choice(rng, PAINT_COLORS, n_rows), 0.18),
+        "is_4wd": _with_missing(rng, np.ones(n_rows), 0.50),
+        "date_posted": dates.take(rng.integers(0, len(dates), n_rows)),
+        "days_listed": np.minimum(rng.gamma(2.0, 20.0, n_rows).astype("int64"), 271),
+    })
+
+
+def write_csv(df, path):
+    """Write ``df`` as a CSV file like the one the app downloads."""
+    pacsv.write_csv(pa.Table.from_pandas(df, preserve_index=False), path)
+
+
+# Pipeline steps, in the order clean_data runs them. Each takes and returns a frame.
+
+def _split_models(df):
+    make, model_type = parse_models(df["model"])
+    return df.assign(make=make, model_type=model_type)
+
+
+def _date_sold(df):
+    date_posted = parse_dates(df["date_posted"])
+    return df.assign(date_posted=date_posted,
+                     date_sold=date_posted + pd.to_timedelta(df["days_listed"], unit="D"))
+
+
+def _schema(df):
+    return apply_schema(df)[0]
+
+
+def _imputation_step(column):
+    rules = [rule for rule in DEFAULT_RULES if rule.column == column]
+    return lambda df: impute(df.copy(deep=False), rules)[0]
+
+
+PIPELINE_STEPS = [
+    ("model_split", _split_models),
+    ("date_sold", _date_sold),
+    ("schema", _schema),
+    ("impute_cylinders", _imputation_step("cylinders")),
+    ("impute_odometer", _imputation_step("odometer")),
+    ("time_buckets", add_time_buckets),
+]
+
+
+def payload_bytes(result):
+    """Size of a stage's output: frame memory, or the bytes of rendered charts."""
+    if isinstance(result, pd.DataFrame):
+        return int(result.memory_usage(deep=True).sum())
+    if isinstance(result, dict):
+        return sum(payload_bytes(value) for value in result.values())
+    if isinstance(result, (list, tuple)):
+        return sum(payload_bytes(value) for value in result)
+    if isinstance(result, str):
+        return len(result.encode())
+    if isinstance(result, bytes):
+        return len(result)
+    return 0
+
+
+def measure(function, repeat=1, memory=True):
+    """Run ``function`` and return ``(result, best seconds, peak MB or None)``."""
+    seconds = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        seconds.append(time.perf_counter() - start)
+
+    peak_mb = None
+    if memory:
+        tracemalloc.start()
+        try:
+            function()
+            peak_mb = tracemalloc.get_traced_memory()[1] / 1024 ** 2
+        finally:
+            tracemalloc.stop()
+    return result, min(seconds), peak_mb
+
+
+def warm_up(specs, clean):
+    """Render ``specs`` once on a small slice.
+
+    Lazy imports and plotly's one-off setup are then not billed to the first chart.
+    """
+    sample = clean.head(1_000)
+    aggregates = build_aggregates(sample)
+    for spec in specs:
+        render(spec, sample, aggregates, "warm-up", {"max_points": SCATTER_MAX_POINTS})
+
+
+def run(n_rows, chart_ids=None, repeat=1, memory=True, seed=0, log=print, workers=1):
+    """Benchmark every stage on ``n_rows`` synthetic listings. Returns result records.
+
+    ``workers`` above 1 times ``clean_data`` in partitioned mode (see partitions.py).
+    """
+    records = []
+
+    def record(stage, function):
+        result, seconds, peak_mb = measure(function, repeat, memory)
+        records.append({
+            "rows": n_rows,
+            "stage": stage,
+            "seconds": round(seconds, 4),
+            "peak_mb": None if peak_mb is None else round(peak_mb, 2),
+            "payload_bytes": payload_bytes(result),
+        })
+        log(f"{n_rows:>10,} {stage:<32} {seconds:9.3f}s")
+        return result
+
+    csv_path = os.path.join(WORK_DIR, f"vehicles_{n_rows}.csv")
+    write_csv(synthetic_vehicles(n_rows, seed), csv_path)
+
+    def load():
+        with open(csv_path, "rb") as source:
+            name, _ = ingest_csv(source, prefix="bench")
+        return read_ingested(name)
+
+    raw = record("ingest", load)
+
+    frame = raw
+    for stage, step in PIPELINE_STEPS:
+        frame = record(f"preprocess:{stage}", lambda step=step, frame=frame: step(frame))
+
+    clean = record("preprocess:clean_data", lambda: clean_data(raw.copy(deep=False), workers))
+    aggregates = record("aggregates", lambda: build_aggregates(clean))
+
+    version = pipeline_key(f"bench-{n_rows}")
+    params = {"max_points": SCATTER_MAX_POINTS}
+    specs = CHARTS if chart_ids is None else [CHARTS_BY_ID[chart_id] for chart_id in chart_ids]
+    warm_up(specs, clean)
+    for spec in specs:
+        record(f"chart:{spec.chart_id}", lambda spec=spec: render(spec, clean, aggregates, version, params))
+
+    os.remove(csv_path)
+    return records
+
+
+def load_baseline(path):
+    """Baseline records keyed by ``(rows, stage)``, or None if there is no baseline."""
+    try:
+        with open(path) as file:
+            saved = json.load(file)
+    except FileNotFoundError:
+        return None
+    return {(record["rows"], record["stage"]): record for record in saved["records"]}
+
+
+def save_baseline(path, records):
+    saved = {
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "machine": platform.machine(),
+        "records": records,
+    }
+    with open(path, "w") as file:
+        json.dump(saved, file, indent=2)
+
+
+def compare(records, baseline, tolerance=TOLERANCE):
+    """Add baseline ratios to ``records`` and return the regressions found."""
+    regressions = []
+    for record in records:
+        base = baseline.get((record["rows"], record["stage"]))
+        if base is None:
+            continue
+        checks = [("seconds", MIN_SECONDS), ("peak_mb", MIN_PEAK_MB), ("payload_bytes", 0)]
+        for field, noise_floor in checks:
+            now, before = record[field], base.get(field)
+            if now is None or not before:
+                continue
+            record[f"{field}_ratio"] = round(now / before, 2)
+            if now > before * (1 + tolerance) and now - before > noise_floor:
+                regressions.append(
+                    f"{record['stage']} at {record['rows']:,} rows: {field} {before} -> {now}"
+                )
+    return regressions
+
+
+def check_memory_budget(records, budget=MEMORY_BUDGET):
+    """Return the ``preprocess:clean_data`` runs whose peak memory is over ``budget``.
+
+    The budget is relative to the raw frame (the ``ingest`` payload of the same
+    size). tracemalloc sees the Python and NumPy allocations, not Arrow's own
+    memory pool.
+    """
+    raw_bytes = {record["rows"]: record["payload_bytes"] for record in records if record["stage"] == "ingest"}
+    over = []
+    for record in records:
+        if record["stage"] != "preprocess:clean_data" or record["peak_mb"] is None:
+            continue
+        limit_mb = budget * raw_bytes[record["rows"]] / 1024 ** 2
+        record["peak_budget_ratio"] = round(record["peak_mb"] / limit_mb, 2)
+        if record["peak_mb"] > limit_mb:
+            over.append(
+                f"{record['stage']} at {record['rows']:,} rows: peak {record['peak_mb']} MB "
+                f"is over the budget of {limit_mb:.1f} MB ({budget}x the raw frame)"
+            )
+    return over
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, nargs="+", default=DEFAULT_ROWS,
+                        help="dataset sizes to benchmark")
+    parser.add_argument("--charts", nargs="+", choices=sorted(CHARTS_BY_ID),
+                        help="chart ids to render (default: all)")
+    parser.add_argument("--repeat", type=int, default=1, help="timed runs per stage (best is kept)")
+    parser.add_argument("--no-memory", action="store_true", help="skip the tracemalloc peak-memory runs")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=1,
+                        help="worker processes for preprocess:clean_data (1 = serial)")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="baseline JSON file")
+    parser.add_argument("--save-baseline", action="store_true", help="store these results as the baseline")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE,
+                        help="allowed relative slowdown / growth before a stage is flagged")
+    parser.add_argument("--memory-budget", type=float, default=MEMORY_BUDGET,
+                        help="allowed clean_data peak memory, as a multiple of the raw frame size")
+    parser.add_argument("--output", help="also write the results to this JSON file")
+    args = parser.parse_args(argv)
+
+    try:
+        records = []
+        for n_rows in args.rows:
+            records.extend(run(n_rows, args.charts, args.repeat, not args.no_memory, args.seed,
+                               workers=args.workers))
+    finally:
+        shutil.rmtree(WORK_DIR, ignore_errors=True)
+
+    # The memory budget holds with or without a baseline
+    regressions = check_memory_budget(records, args.memory_budget)
+    if args.save_baseline:
+        save_baseline(args.baseline, records)
+        print(f"Baseline written to {args.baseline}")
+    else:
+        baseline = load_baseline(args.baseline)
+        if baseline is None:
+            print(f"No baseline at {args.baseline} (run with --save-baseline to create one)")
+        else:
+            regressions += compare(records, baseline, args.tolerance)
+
+    print()
+    print(pd.DataFrame(records).to_string(index=False))
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(records, file, indent=2)
+
+    if regressions:
+        print(f"\n{len(regressions)} regression(s):")
+        for regression in regressions:
+            print(f"  {regression}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
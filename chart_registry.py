@@ -0,0 +1,583 @@
+"""Chart registry for app.py.
+
+Every chart in the sidebar menu is a ``ChartSpec``: the columns it needs, a
+``prepare`` step that turns the cleaned frame (or the aggregate store) into the
+chart's data, and a ``build`` step that turns that data into figures. Plotly
+figures are kept as serialized JSON and seaborn charts as PNG bytes in a
+``FigureCache``, keyed on (chart id, dataset version, parameters), so switching
+back to a chart that was already drawn skips the grouping and serialization.
+"""
+
+import os
+import threading
+from collections import OrderedDict, namedtuple
+
+from aggregates import median, rollup
+from diagnostics import record_miss, span, timed_import
+from model_names import display_make
+
+ChartSpec = namedtuple(
+    "ChartSpec",
+    ["chart_id", "label", "subheader", "required_columns", "prepare", "build", "kind", "params", "caption"],
+)
+ChartSpec.__new__.__defaults__ = ("plotly", (), None)
+
+# Total size of the rendered charts kept by the figure cache (figure JSON / PNG bytes)
+FIGURE_CACHE_MAX_BYTES = int(os.environ.get("FIGURE_CACHE_MB", "256")) * 1024 * 1024
+
+
+class FigureCache:
+    """Thread-safe LRU cache of rendered charts, shared by all sessions, up to a byte budget."""
+
+    def __init__(self, max_bytes=FIGURE_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        # key -> (output, nbytes)
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return self._entries[key][0]
+
+    def put(self, key, value):
+        nbytes = sum(len(item) for item in value)
+        with self._lock:
+            if key in self._entries:
+                self._bytes -= self._entries.pop(key)[1]
+            if nbytes > self.max_bytes:
+                # Too big to cache at all
+                return
+            self._entries[key] = (value, nbytes)
+            self._bytes += nbytes
+            while self._bytes > self.max_bytes:
+                _, (_, dropped) = self._entries.popitem(last=False)
+                self._bytes -= dropped
+
+    def nbytes(self):
+        """Total size of the cached charts."""
+        with self._lock:
+            return self._bytes
+
+    def __len__(self):
+        return len(self._entries)
+
+
+def missing_columns(spec, df):
+    """Columns ``spec`` needs that ``df`` does not have."""
+    return [column for column in spec.required_columns if column not in df.columns]
+
+
+def render(spec, df, aggregates, dataset_version, params=None, cache=None):
+    """Return the rendered output of ``spec`` for this dataset and parameters.
+
+    Plotly charts come back as a list of figure JSON strings, seaborn charts as a
+    list of PNG bytes.
+    """
+    params = {name: value for name, value in (params or {}).items() if name in spec.params}
+    key = (spec.chart_id, dataset_version, tuple(sorted(params.items())))
+
+    if cache is not None:
+        cached = cache.get(key)
+        if cached is not None:
+            return cached
+
+    record_miss("figure_cache")
+    with span("chart.prepare"):
+        data = spec.prepare(df, aggregates, **params)
+    with span("chart.build"):
+        figures = spec.build(data)
+    with span("chart.serialize"):
+        if spec.kind == "plotly":
+            output = [fig.to_json() for fig in figures]
+        else:
+            output = list(figures)
+
+    if cache is not None:
+        cache.put(key, output)
+    return output
+
+
+# Scatter plots
+
+def _scatter_spec(chart_id, label, subheader, x, y, title, labels):
+    def prepare(df, aggregates, max_points):
+        return df, max_points
+
+    def build(data):
+        charts = timed_import("charts")
+        frame, max_points = data
+        # Scatter segmented by condition (WebGL, sampled or binned for large data)
+        fig, _ = charts.scatter_figure(
+            frame,
+            x=x,
+            y=y,
+            color="condition",
+            title=title,
+            labels=labels,
+            max_points=max_points,
+        )
+        return [fig]
+
+    def caption(df, max_points):
+        charts = timed_import("charts")
+        mode = charts.scatter_mode(len(df), max_points)
+        return charts.describe_scatter_mode(mode, len(df), max_points)
+
+    return ChartSpec(
+        chart_id, label, subheader, (x, y, "condition"), prepare, build,
+        params=("max_points",), caption=caption,
+    )
+
+
+# Bar Plot: Total Price by Decade Range
+
+def _prepare_total_price_by_decade(df, aggregates):
+    # Calculate total price by model year range and make. The decade column is an
+    # ordered categorical (features.py), so the roll-up comes back in decade order.
+    return (
+        rollup(aggregates, ["model_year_range", "make"], ["price_sum"])
+        .rename(columns={"price_sum": "price"})
+    )
+
+
+def _build_total_price_by_decade(total_price_by_decade_make):
+    px = timed_import("plotly.express")
+    # Create an interactive bar plot with Plotly Express
+    fig = px.bar(
+        total_price_by_decade_make,
+        x="model_year_range",
+        y="price",
+        color="make",  # Differentiate by car make
+        title="Total Price by Model Year Decade and Make",
+        labels={"model_year_range": "Model Year Decade", "price": "Total Price (USD)", "make": "Car Make"},
+    )
+
+    # Customize layout
+    fig.update_traces(textposition="outside")  # Position text labels outside bars
+    fig.update_layout(
+        xaxis=dict(title="Model Year Decade", tickangle=0, tickfont=dict(size=10)),
+        yaxis=dict(title="Total Price (USD)", tickfont=dict(size=10)),
+        title=dict(font=dict(size=14)),
+        legend_title="Car Make",  # Add legend for car makes
+    )
+    return [fig]
+
+
+# Bar Plot: Sales and Revenue by Car Make
+
+def _prepare_sales_by_make(df, aggregates):
+    # Calculate total car sales and revenue by make and condition
+    return rollup(aggregates, ["make", "condition"], ["price_count", "price_sum"])
+
+
+def _build_sales_by_make(by_make_condition):
+    px = timed_import("plotly.express")
+    sales_by_make_condition = by_make_condition[["make", "condition", "price_count"]].rename(
+        columns={"price_count": "total_sales"}
+    )
+    revenue_by_make_condition = by_make_condition[["make", "condition", "price_sum"]].rename(
+        columns={"price_sum": "total_revenue"}
+    )
+
+    # Create the first Plotly bar chart: Total car sales by make and condition
+    fig1 = px.bar(
+        sales_by_make_condition,
+        x="make",
+        y="total_sales",
+        color="condition",
+        title="Distribution of Car Sales by Make and Condition",
+        labels={"make": "Car Make", "total_sales": "Total Sales", "condition": "Condition"},
+        text="total_sales",
+        color_discrete_sequence=px.colors.sequential.Viridis,
+    )
+
+    # Customize the layout for fig1
+    fig1.update_traces(textposition="outside")
+    fig1.update_layout(
+        xaxis=dict(title="Car Make", tickangle=45),
+        yaxis=dict(title="Total Sales"),
+        title=dict(font=dict(size=16)),
+        legend_title="Condition",
+    )
+
+    # Create the second Plotly bar chart: Total sales revenue by make and condition
+    fig2 = px.bar(
+        revenue_by_make_condition,
+        x="make",
+        y="total_revenue",
+        color="condition",
+        title="Distribution of Sales Revenue by Make and Condition",
+        labels={"make": "Car Make", "total_revenue": "Total Revenue (USD)", "condition": "Condition"},
+        text=revenue_by_make_condition["total_revenue"].apply(lambda x: f"${x / 1e6:.2f}M"),
+        color_discrete_sequence=px.colors.sequential.Plasma,
+    )
+
+    # Customize the layout for fig2
+    fig2.update_traces(textposition="outside")
+    fig2.update_layout(
+        xaxis=dict(title="Car Make", tickangle=45),
+        yaxis=dict(title="Total Revenue (USD)"),
+        title=dict(font=dict(size=16)),
+        legend_title="Condition",
+    )
+    return [fig1, fig2]
+
+
+# Bar Plot: Car Brand - Pricing Distribution
+
+def _prepare_price_by_brand(df, aggregates):
+    # Calculate the average price by make and condition, sorted by price
+    avg_price_by_make_condition = (
+        rollup(aggregates, ["make", "condition"], ["price_mean"])
+        .rename(columns={"price_mean": "price"})
+        .sort_values(by="price", ascending=False)
+    )
+
+    # Display names for "make" and "condition", mapped once per category rather than per row
+    avg_price_by_make_condition["make"] = (
+        avg_price_by_make_condition["make"].astype("category").cat.rename_categories(display_make)
+    )
+    avg_price_by_make_condition["condition"] = (
+        avg_price_by_make_condition["condition"].astype("category").cat.rename_categories(str.capitalize)
+    )
+    return avg_price_by_make_condition
+
+
+def _build_price_by_brand(avg_price_by_make_condition):
+    px = timed_import("plotly.express")
+    # Create the Plotly bar chart
+    fig = px.bar(
+        avg_price_by_make_condition,
+        x="make",
+        y="price",
+        color="condition",  # Use condition as the color-coded category
+        title="Dealership Car Brand Average Pricing by Condition",
+        labels={"make": "Car Brand", "price": "Average Price (USD)", "condition": "Condition"},
+        color_discrete_sequence=px.colors.qualitative.Set3,  # Set a qualitative color palette
+    )
+
+    # Customize the layout
+    fig.update_traces(textposition="outside")  # Position labels outside the bars
+    fig.update_layout(
+        xaxis=dict(title="Car Brand", tickangle=90, tickfont=dict(size=10)),
+        yaxis=dict(title="Average Price (USD)", tickfont=dict(size=10)),
+        title=dict(font=dict(size=14)),  # Adjust title font size
+    )
+    return [fig]
+
+
+# Bar Plot: Average Price and Total Sales by Fuel Type
+
+def _prepare_price_by_fuel(df, aggregates):
+    # Calculate average price and total sales by fuel type and condition
+    return rollup(aggregates, ["fuel", "condition"], ["price_mean", "price_count"])
+
+
+def _build_price_by_fuel(by_fuel_condition):
+    px = timed_import("plotly.express")
+    avg_price_by_fuel_condition = by_fuel_condition[["fuel", "condition", "price_mean"]].rename(
+        columns={"price_mean": "average_price"}
+    )
+    total_sales_by_fuel_condition = by_fuel_condition[["fuel", "condition", "price_count"]].rename(
+        columns={"price_count": "total_sales"}
+    )
+
+    # Create the first Plotly bar chart: Average Price by Fuel Type and Condition
+    fig1 = px.bar(
+        avg_price_by_fuel_condition,
+        x="fuel",
+        y="average_price",
+        color="condition",  # Differentiate bars by condition
+        title="Average Price by Fuel Type and Condition",
+        labels={"fuel": "Fuel Type", "average_price": "Average Price (USD)", "condition": "Condition"},
+        text=avg_price_by_fuel_condition["average_price"].apply(lambda x: f"${x:,.0f}"),  # Add labels
+        color_discrete_sequence=px.colors.qualitative.Vivid,  # Set a qualitative color palette
+    )
+
+    # Customize the layout for fig1
+    fig1.update_traces(textposition="outside")
+    fig1.update_layout(
+        xaxis=dict(title="Fuel Type"),
+        yaxis=dict(title="Average Price (USD)"),
+        title=dict(font=dict(size=16)),
+        legend_title="Condition",
+    )
+
+    # Create the second Plotly bar chart: Total Sales by Fuel Type and Condition
+    fig2 = px.bar(
+        total_sales_by_fuel_condition,
+        x="fuel",
+        y="total_sales",
+        color="condition",  # Differentiate bars by condition
+        title="Total Sales by Fuel Type and Condition",
+        labels={"fuel": "Fuel Type", "total_sales": "Total Sales", "condition": "Condition"},
+        text=total_sales_by_fuel_condition["total_sales"],  # Add labels
+        color_discrete_sequence=px.colors.qualitative.Pastel,  # Set a qualitative color palette
+    )
+
+    # Customize the layout for fig2
+    fig2.update_traces(textposition="outside")
+    fig2.update_layout(
+        xaxis=dict(title="Fuel Type"),
+        yaxis=dict(title="Total Sales"),
+        title=dict(font=dict(size=16)),
+        legend_title="Condition",
+    )
+    return [fig1, fig2]
+
+
+# Bar Plot: Average Days Listing by Car Brand
+
+def _prepare_days_listed_by_brand(df, aggregates):
+    # Calculate the average number of days listed by brand
+    fastest_selling_brands = (
+        rollup(aggregates, ["make"], ["days_listed_mean"])
+        .rename(columns={"days_listed_mean": "days_listed"})
+    )
+    return fastest_selling_brands.sort_values(by="days_listed")
+
+
+def _build_days_listed_by_brand(fastest_selling_brands):
+    static_charts = timed_import("static_charts")
+    return [static_charts.days_listed_by_brand_png(fastest_selling_brands)]
+
+
+# Bar Plot: Sales by Model Year Decade Range
+
+def _prepare_sales_by_decade(df, aggregates):
+    # Calculate median price by model year range and make
+    median_price_by_decade_make = (
+        median(aggregates, ["model_year_range", "make"])
+        .rename(columns={"price_median": "median_price"})
+    )
+
+    # Calculate total cars listed by model year range and make
+    total_cars_by_decade_make = (
+        rollup(aggregates, ["model_year_range", "make"], ["rows"])
+        .rename(columns={"rows": "total_cars"})
+    )
+    return median_price_by_decade_make, total_cars_by_decade_make
+
+
+def _build_sales_by_decade(data):
+    px = timed_import("plotly.express")
+    median_price_by_decade_make, total_cars_by_decade_make = data
+
+    # Create the first Plotly bar chart: Median Price by Decade and Make
+    fig1 = px.bar(
+        median_price_by_decade_make,
+        x="model_year_range",
+        y="median_price",
+        color="make",  # Differentiate by car make
+        title="Median Car Price by Decade and Make",
+        labels={"model_year_range": "Model Year Decade", "median_price": "Median Price (USD)", "make": "Car Make"},
+        text=median_price_by_decade_make["median_price"].apply(lambda x: f"${x / 1e3:.2f}K"),  # Add formatted labels
+        color_discrete_sequence=px.colors.qualitative.Vivid,
+    )
+
+    # Customize layout for fig1
+    fig1.update_traces(textposition="outside")
+    fig1.update_layout(
+        xaxis=dict(title="Model Year Decade", tickangle=0),
+        yaxis=dict(title="Median Price (USD)"),
+        title=dict(font=dict(size=16)),
+        legend_title="Car Make",
+    )
+
+    # Create the second Plotly bar chart: Total Cars Listed by Decade and Make
+    fig2 = px.bar(
+        total_cars_by_decade_make,
+        x="model_year_range",
+        y="total_cars",
+        color="make",  # Differentiate by car make
+        title="Total Cars Listed by Decade and Make",
+        labels={"model_year_range": "Model Year Decade", "total_cars": "Total Cars Listed", "make": "Car Make"},
+        text=total_cars_by_decade_make["total_cars"],  # Add labels
+        color_discrete_sequence=px.colors.qualitative.Pastel,
+    )
+
+    # Customize layout for fig2
+    fig2.update_traces(textposition="outside")
+    fig2.update_layout(
+        xaxis=dict(title="Model Year Decade", tickangle=0),
+        yaxis=dict(title="Total Cars Listed"),
+        title=dict(font=dict(size=16)),
+        legend_title="Car Make",
+    )
+    return [fig1, fig2]
+
+
+# Histograms: Price and Days Listed Distribution (seaborn)
+
+def _prepare_frame(df, aggregates):
+    return df
+
+
+def _build_price_histogram(df):
+    static_charts = timed_import("static_charts")
+    return [static_charts.price_histogram_png(df)]
+
+
+def _build_days_listed_histogram(df):
+    static_charts = timed_import("static_charts")
+    return [static_charts.days_listed_histogram_png(df)]
+
+
+# Histogram: Odometer Distribution
+
+def _prepare_odometer_histogram(df, aggregates):
+    charts = timed_import("charts")
+    # Bin the odometer readings on the server, with a strip of quantiles per condition
+    counts = charts.histogram_counts(df, "odometer", by="condition", bins=50)
+    strip = charts.quantile_strip(df, "odometer", by="condition")
+    return counts, strip
+
+
+def _build_odometer_histogram(data):
+    px = timed_import("plotly.express")
+    charts = timed_import("charts")
+    counts, strip = data
+
+    # Draw the bin counts as bars, with the quantile strip in place of a rug plot
+    fig = charts.histogram_figure(
+        counts,
+        "odometer",
+        by="condition",  # Segment by condition
+        strip=strip,
+        title="Vehicle Mileage Distribution by Condition",
+        labels={"odometer": "Odometer (Miles)", "count": "Count of Cars on Sale", "condition": "Condition"},
+        opacity=0.8,  # Adjust bar opacity
+        color_discrete_sequence=px.colors.qualitative.Set2,  # Use a qualitative color palette
+    )
+
+    # Customize the layout
+    fig.update_layout(
+        title=dict(font=dict(size=16)),
+        legend_title="Condition",
+        bargap=0.1,  # Adjust spacing between bars
+    )
+    fig.update_xaxes(title="Odometer (Miles)", title_font=dict(size=12), row=2, col=1)
+    fig.update_yaxes(title="Count of Cars on Sale", title_font=dict(size=12), row=2, col=1)
+
+    # Add gridlines
+    fig.update_xaxes(showgrid=True, gridwidth=0.5, gridcolor="lightgray")
+    fig.update_yaxes(showgrid=True, gridwidth=0.5, gridcolor="lightgray")
+    return [fig]
+
+
+# All charts, in sidebar order
+CHARTS = [
+    _scatter_spec(
+        "odometer_vs_days_listed",
+        "Scatter Plot: Odometer vs. Days Listed (Segmented by Condition)",
+        "Odometer vs. Days Listed (Segmented by Condition)",
+        x="odometer",
+        y="days_listed",
+        title="Odometer vs. Days Listed by Condition",
+        labels={"odometer": "Odometer (miles)", "days_listed": "Days Listed"},
+    ),
+    _scatter_spec(
+        "price_vs_days_listed",
+        "Scatter Plot: Price vs. Days Listed (Segmented by Condition)",
+        "Price vs. Days Listed (Segmented by Condition)",
+        x="price",
+        y="days_listed",
+        title="Price vs. Days Listed by Condition",
+        labels={"price": "Total Price (USD)", "days_listed": "Days Listed"},
+    ),
+    _scatter_spec(
+        "price_vs_odometer",
+        "Scatter Plot: Price vs. Odometer (Segmented by Condition)",
+        "Price vs. Odometer (Segmented by Condition)",
+        x="price",
+        y="odometer",
+        title="Price vs. Odometer by Condition",
+        labels={"price": "Total Price (USD)", "odometer": "Odometer (Miles)"},
+    ),
+    ChartSpec(
+        "total_price_by_decade",
+        "Bar Plot: Total Price by Decade Range",
+        "Total Sale Price by Decade Range",
+        ("model_year", "make", "price"),
+        _prepare_total_price_by_decade,
+        _build_total_price_by_decade,
+    ),
+    ChartSpec(
+        "sales_by_make",
+        "Bar Plot: Sales and Revenue by Car Make",
+        "Sales and Revenue by Car Make",
+        ("make", "condition", "price"),
+        _prepare_sales_by_make,
+        _build_sales_by_make,
+    ),
+    ChartSpec(
+        "price_by_brand",
+        "Bar Plot: Car Brand - Pricing Distribution",
+        "Average Price by Car Make",
+        ("make", "condition", "price"),
+        _prepare_price_by_brand,
+        _build_price_by_brand,
+    ),
+    ChartSpec(
+        "price_by_fuel",
+        "Bar Plot: Average Price and Total Sales by Fuel Type",
+        "Average Price and Total Sales by Fuel Type",
+        ("fuel", "condition", "price"),
+        _prepare_price_by_fuel,
+        _build_price_by_fuel,
+    ),
+    ChartSpec(
+        "days_listed_by_brand",
+        "Bar Plot: Average Days Listing by Car Brand",
+        "Average Days Listing by Car Brand",
+        ("make", "days_listed"),
+        _prepare_days_listed_by_brand,
+        _build_days_listed_by_brand,
+        kind="image",
+    ),
+    ChartSpec(
+        "sales_by_decade",
+        "Bar Plot: Sales by Model Year Decade Range",
+        "Sales by Model Year Decade Range",
+        ("model_year", "make", "price"),
+        _prepare_sales_by_decade,
+        _build_sales_by_decade,
+    ),
+    ChartSpec(
+        "price_histogram",
+        "Histogram: Price Distribution",
+        "Price Distribution",
+        ("price",),
+        _prepare_frame,
+        _build_price_histogram,
+        kind="image",
+    ),
+    ChartSpec(
+        "days_listed_histogram",
+        "Histogram: Days Listed Distribution",
+        "Days Listed Distribution",
+        ("days_listed", "condition"),
+        _prepare_frame,
+        _build_days_listed_histogram,
+        kind="image",
+    ),
+    ChartSpec(
+        "odometer_histogram",
+        "Histogram: Odometer Distribution",
+        "Vehicle Mileage Distribution",
+        ("odometer", "condition"),
+        _prepare_odometer_histogram,
+        _build_odometer_histogram,
+    ),
+]
+
+CHARTS_BY_LABEL = {spec.label: spec for spec in CHARTS}
+CHARTS_BY_ID = {spec.chart_id: spec for spec in CHARTS}
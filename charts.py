@@ -0,0 +1,334 @@
+"""Figure builders shared by the chart branches of app.py."""
+
+import numpy as np
+import pandas as pd
+import plotly.express as px
+import plotly.graph_objects as go
+from plotly.subplots import make_subplots
+
+from sketches import build_sketches, sketch_quantile, use_sketches
+
+# Scatter plots above this many rows are drawn with WebGL instead of SVG
+WEBGL_THRESHOLD = 1_000
+
+# Default number of points sent to the browser before sampling kicks in
+SCATTER_MAX_POINTS = 50_000
+
+# Inputs above this many rows are drawn as a binned density heatmap
+DENSITY_THRESHOLD = 1_000_000
+
+# Bins per axis for the density heatmap
+DENSITY_BINS = 100
+
+
+def stratified_sample(df, by, n, random_state=0):
+    """Sample about ``n`` rows of ``df``, keeping each ``by`` group's share."""
+    if len(df) <= n:
+        return df
+    frac = n / len(df)
+    return df.groupby(by, observed=True, group_keys=False).sample(frac=frac, random_state=random_state)
+
+
+def scatter_mode(n_rows, max_points=SCATTER_MAX_POINTS, density_threshold=DENSITY_THRESHOLD):
+    """Pick how a scatter of ``n_rows`` points is drawn.
+
+    ``"svg"`` and ``"webgl"`` draw every point, ``"sampled"`` draws a stratified
+    sample of ``max_points`` with WebGL, and ``"density"`` draws a 2-D histogram.
+    """
+    if n_rows > density_threshold:
+        return "density"
+    if n_rows > max_points:
+        return "sampled"
+    if n_rows > WEBGL_THRESHOLD:
+        return "webgl"
+    return "svg"
+
+
+def density_figure(df, x, y, title, labels, bins=DENSITY_BINS):
+    """2-D histogram of ``x`` vs ``y`` binned on the server."""
+    data = df[[x, y]].dropna().astype("float64")
+    counts, x_edges, y_edges = np.histogram2d(data[x], data[y], bins=bins)
+    fig = go.Figure(
+        go.Heatmap(
+            x=(x_edges[:-1] + x_edges[1:]) / 2,
+            y=(y_edges[:-1] + y_edges[1:]) / 2,
+            # histogram2d is indexed [x, y]; heatmaps are [row=y, column=x]
+            z=np.where(counts.T > 0, counts.T, np.nan),
+            colorscale="Viridis",
+            colorbar=dict(title="Listings"),
+        )
+    )
+    fig.update_layout(
+        title=title,
+        xaxis_title=labels.get(x, x),
+        yaxis_title=labels.get(y, y),
+    )
+    return fig
+
+
+def scatter_figure(df, x, y, color, title, labels, max_points=SCATTER_MAX_POINTS,
+                   density_threshold=DENSITY_THRESHOLD):
+    """Scatter plot that stays cheap to ship as the data grows.
+
+    Returns ``(fig, mode)``, where ``mode`` is one of the values of ``scatter_mode``.
+    """
+    mode = scatter_mode(len(df), max_points, density_threshold)
+    if mode == "density":
+        return density_figure(df, x, y, title, labels), mode
+
+    # Only ship the columns the chart uses
+    data = df[[x, y, color]]
+    if mode == "sampled":
+        data = stratified_sample(data, color, max_points)
+
+    fig = px.scatter(
+        data,
+        x=x,
+        y=y,
+        color=color,
+        title=title,
+        labels=labels,
+        render_mode="svg" if mode == "svg" else "webgl",
+    )
+    return fig, mode
+
+
+def describe_scatter_mode(mode, n_rows, max_points=SCATTER_MAX_POINTS):
+    """Short caption telling the user how a scatter plot was drawn."""
+    if mode == "density":
+        return f"Density mode: {n_rows:,} listings binned on a {DENSITY_BINS}x{DENSITY_BINS} grid."
+    if mode == "sampled":
+        return f"Sampled mode: showing a {max_points:,}-point sample of {n_rows:,} listings, stratified by condition (WebGL)."
+    if mode == "webgl":
+        return f"WebGL mode: showing all {n_rows:,} listings."
+    return f"Showing all {n_rows:,} listings."
+
+
+def histogram_counts(df, column, by=None, bins=50):
+    """Bin ``column`` on the server, optionally per ``by`` group.
+
+    All groups share the same bin edges. Returns a frame with ``bin_start``,
+    ``bin_end``, ``bin_mid``, ``count`` and, when grouped, the ``by`` column.
+    """
+    values = df[column].dropna().astype("float64")
+    edges = np.histogram_bin_edges(values, bins=bins)
+
+    if by is None:
+        groups = [(None, values)] if len(values) else []
+    else:
+        data = df[[column, by]].dropna()
+        groups = [
+            (key, group[column].astype("float64"))
+            for key, group in data.groupby(by, observed=True)
+        ]
+
+    tables = []
+    for key, group_values in groups:
+        counts, _ = np.histogram(group_values, bins=edges)
+        table = pd.DataFrame({
+            "bin_start": edges[:-1],
+            "bin_end": edges[1:],
+            "bin_mid": (edges[:-1] + edges[1:]) / 2,
+            "count": counts,
+        })
+        if by is not None:
+            table[by] = key
+        tables.append(table)
+    if not tables:
+        # No rows with a value: an empty table with the usual columns
+        columns = ["bin_start", "bin_end", "bin_mid", "count"] + ([by] if by is not None else [])
+        return pd.DataFrame({name: pd.Series(dtype="int64" if name == "count" else "float64") for name in columns})
+    return pd.concat(tables, ignore_index=True)
+
+
+def quantile_strip(df, column, by=None, quantiles=np.linspace(0.01, 0.99, 25), engine=None):
+    """Quantiles of ``column`` (per ``by`` group), a compact stand-in for a rug plot.
+
+    With the sketch quantile engine each group is summarised once as a sketch
+    and every quantile is read from it, instead of sorting each group.
+    """
+    if use_sketches(engine):
+        frame = df[[column]].assign(_group=0) if by is None else df
+        keys = ["_group"] if by is None else [by]
+        sketches = build_sketches(frame, keys, column)
+        table = pd.concat([sketch_quantile(sketches, keys, q) for q in quantiles], ignore_index=True)
+        table = table.rename(columns={"value": column}).sort_values(keys, kind="stable")
+        return table[[column]].reset_index(drop=True) if by is None else table[[by, column]].reset_index(drop=True)
+    if by is None:
+        values = df[column].dropna()
+        # No values: no quantiles (rather than a column of NaN)
+        return pd.DataFrame({column: values.quantile(quantiles).to_numpy() if len(values) else np.array([])})
+    table = (
+        df.groupby(by, observed=True)[column]
+        .quantile(quantiles)
+        .reset_index()
+    )
+    return table[[by, column]]
+
+
+def histogram_figure(counts, column, by=None, strip=None, title=None, labels=None,
+                     color_discrete_sequence=None, opacity=None):
+    """Bar chart of precomputed ``histogram_counts``.
+
+    If ``strip`` (from ``quantile_strip``) is given, its quantiles are drawn as
+    tick marks in a narrow panel above the bars, like a rug plot.
+    """
+    labels = labels or {}
+    fig = px.bar(
+        counts,
+        x="bin_mid",
+        y="count",
+        color=by,
+        title=title,
+        labels={"bin_mid": labels.get(column, column), **labels},
+        hover_data={"bin_start": True, "bin_end": True, "bin_mid": False},
+        color_discrete_sequence=color_discrete_sequence,
+        opacity=opacity,
+    )
+
+    if strip is None:
+        return fig
+
+    combined = make_subplots(rows=2, cols=1, shared_xaxes=True, row_heights=[0.15, 0.85],
+                             vertical_spacing=0.02)
+    for trace in fig.data:
+        combined.add_trace(trace, row=2, col=1)
+
+    # One row of quantile ticks per group, coloured like the bars
+    colors = {trace.name: trace.marker.color for trace in fig.data}
+    strip_groups = strip.groupby(by, observed=True) if by is not None else [(None, strip)]
+    for key, group in strip_groups:
+        name = str(key) if key is not None else column
+        combined.add_trace(
+            go.Scatter(
+                x=group[column],
+                y=[name] * len(group),
+                mode="markers",
+                marker=dict(symbol="line-ns-open", color=colors.get(name)),
+                name=name,
+                legendgroup=name,
+                showlegend=False,
+                hovertemplate="%{x}<extra>" + name + "</extra>",
+            ),
+            row=1,
+            col=1,
+        )
+    # Axis titles belong to the bar panel (row 2); the strip only needs its ticks
+    combined.update_layout(title=fig.layout.title, legend=fig.layout.legend, barmode="relative")
+    combined.update_xaxes(title_text=fig.layout.xaxis.title.text, row=2, col=1)
+    combined.update_yaxes(title_text=fig.layout.yaxis.title.text, row=2, col=1)
+    combined.update_yaxes(showticklabels=False, row=1, col=1)
+    return combined
+
+
+# Outliers drawn per box; the rest are counted but not sent to the browser
+MAX_OUTLIERS = 200
+
+# Columns of box_stats, after the group column
+BOX_STATS = ["q1", "median", "q3", "mean", "count", "lowerfence", "upperfence", "outliers"]
+
+
+def box_stats(df, column, by=None, max_outliers=MAX_OUTLIERS, random_state=0):
+    """Box plot statistics of ``column``, per ``by`` group, computed on the server.
+
+    Returns ``(stats, outliers)``. ``stats`` has one row per group: quartiles,
+    mean, count, the whiskers (the furthest values within 1.5 IQR of the box, as
+    plotly draws them) and the number of outliers. ``outliers`` is a sample of
+    at most ``max_outliers`` values per group beyond the whiskers. Both are
+    empty when ``column`` has no values. ``by`` may be ``column`` itself.
+    """
+    present = df[column].notna()
+    if by is not None:
+        present &= df[by].notna()
+    values = df[column][present].astype("float64")
+    keys = pd.Series(0, index=values.index) if by is None else df[by][present]
+
+    if values.empty:
+        stats = pd.DataFrame({name: pd.Series(dtype="float64") for name in BOX_STATS})
+        outliers = pd.DataFrame({column: pd.Series(dtype="float64")})
+        if by is not None:
+            stats.insert(0, by, keys.iloc[:0].to_numpy())
+            if by != column:
+                outliers[by] = keys.iloc[:0].to_numpy()
+        return stats, outliers
+
+    groups = values.groupby(keys, observed=True, sort=True)
+
+    stats = groups.quantile([0.25, 0.5, 0.75]).unstack()
+    stats.columns = ["q1", "median", "q3"]
+    stats["mean"] = groups.mean()
+    stats["count"] = groups.size()
+    iqr = stats["q3"] - stats["q1"]
+
+    # Per-row fences, then the extreme values inside them
+    codes = stats.index.get_indexer(keys)
+    low = (stats["q1"] - 1.5 * iqr).to_numpy()[codes]
+    high = (stats["q3"] + 1.5 * iqr).to_numpy()[codes]
+    inside = (values >= low) & (values <= high)
+    stats["lowerfence"] = values[inside].groupby(keys[inside], observed=True).min()
+    stats["upperfence"] = values[inside].groupby(keys[inside], observed=True).max()
+    stats["outliers"] = (~inside).groupby(keys, observed=True).sum()
+
+    # A random sample of each group's outliers, in a fixed order between reruns
+    outliers = values[~inside].to_frame().assign(group=keys[~inside])
+    outliers = (
+        outliers.sample(frac=1, random_state=random_state)
+        .groupby("group", observed=True, sort=False)
+        .head(max_outliers)
+    )
+
+    if by is None or by == column:
+        # Grouped by its own values, each outlier's value is its group key
+        outliers = outliers.drop(columns="group").reset_index(drop=True)
+    else:
+        outliers = outliers.rename(columns={"group": by}).reset_index(drop=True)
+    if by is None:
+        return stats.reset_index(drop=True), outliers
+    return stats.reset_index(names=by), outliers
+
+
+def box_figure(stats, outliers, column, by=None, title=None):
+    """Box plot drawn from precomputed ``box_stats``; only the statistics are shipped."""
+    names = stats[by].astype(str).tolist() if by is not None else [column]
+    fig = go.Figure(
+        go.Box(
+            x=names,
+            q1=stats["q1"],
+            median=stats["median"],
+            q3=stats["q3"],
+            lowerfence=stats["lowerfence"],
+            upperfence=stats["upperfence"],
+            mean=stats["mean"],
+            name=column,
+            showlegend=False,
+        )
+    )
+    if len(outliers):
+        outlier_names = outliers[by].astype(str) if by is not None else [column] * len(outliers)
+        counts = dict(zip(names, stats["outliers"]))
+        fig.add_trace(
+            go.Scatter(
+                x=outlier_names,
+                y=outliers[column],
+                mode="markers",
+                marker=dict(size=4, color=fig.data[0].marker.color),
+                name="outliers",
+                showlegend=False,
+                customdata=[counts[name] for name in outlier_names],
+                hovertemplate="%{y}<extra>outlier (%{customdata} in group)</extra>",
+            )
+        )
+    fig.update_layout(title=title, xaxis_title=by, yaxis_title=column)
+    return fig
+
+
+def bar_totals(df, x, y, statistic="sum"):
+    """``statistic`` of ``y`` per ``x`` value: one bar per group instead of one per row.
+
+    ``"sum"`` draws the same bar heights as stacking every row. Returns a frame
+    of ``x`` and the values, named ``y`` (or ``"<y> (<statistic>)"`` when
+    ``x`` and ``y`` are the same column).
+    """
+    name = y if y != x else f"{y} ({statistic})"
+    totals = df[y].groupby(df[x], observed=True, sort=True).agg(statistic)
+    return pd.DataFrame({x: totals.index, name: totals.to_numpy()})
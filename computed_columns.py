@@ -0,0 +1,283 @@
+"""Computed columns for app2.py, defined by expressions such as ``price / odometer``.
+
+An expression may use column names (in backticks if they are not identifiers),
+numbers, quoted strings, arithmetic (powers with a small literal exponent),
+comparisons, ``&``/``|``/``~`` and the math functions of ``DataFrame.eval``
+(``sqrt``, ``log``, ``abs``, ...). Anything else (attribute access, calls to
+other functions, subscripts) is rejected before evaluation, so user input never
+reaches Python's ``eval``. Expressions are
+evaluated with ``DataFrame.eval``, which uses numexpr when it is installed.
+
+Dates work as in a spreadsheet: ``date_posted + days_listed`` adds days to a
+date column (text columns holding ISO dates count as dates), and the difference
+of two dates is a number of days.
+
+``ComputedColumns`` keeps the definitions of one session and their dependency
+graph. A column may use other computed columns. Every result is cached under a
+signature of its expression and the expressions it depends on, so editing one
+column only recomputes that column and the columns downstream of it.
+"""
+
+import ast
+import re
+from collections import namedtuple
+
+import pandas as pd
+
+from preprocessing import parse_iso_dates
+
+ComputedColumn = namedtuple("ComputedColumn", ["name", "expression", "dependencies"])
+
+# Math functions DataFrame.eval supports
+FUNCTIONS = {
+    "sin", "cos", "tan", "exp", "log", "expm1", "log1p", "sqrt", "sinh", "cosh", "tanh",
+    "arcsin", "arccos", "arctan", "arccosh", "arcsinh", "arctanh", "abs", "log10",
+    "floor", "ceil", "arctan2",
+}
+
+# Syntax allowed in an expression
+ALLOWED_NODES = (
+    ast.Expression, ast.BinOp, ast.UnaryOp, ast.Compare, ast.BoolOp, ast.Name, ast.Load,
+    ast.Constant, ast.Call,
+    ast.Add, ast.Sub, ast.Mult, ast.Div, ast.FloorDiv, ast.Mod, ast.Pow,
+    ast.USub, ast.UAdd, ast.Not, ast.Invert, ast.BitAnd, ast.BitOr, ast.And, ast.Or,
+    ast.Eq, ast.NotEq, ast.Lt, ast.LtE, ast.Gt, ast.GtE,
+)
+
+# Longest expression accepted
+MAX_EXPRESSION_LENGTH = 500
+
+# Largest exponent accepted: constant powers are folded with Python integers,
+# so something like 9 ** 9 ** 8 would stall the session
+MAX_EXPONENT = 16
+
+_BACKTICKED = re.compile(r"`([^`]+)`")
+
+
+class ExpressionError(ValueError):
+    """An expression that is not allowed or cannot be evaluated."""
+
+
+def _small_exponent(node):
+    """Whether ``node`` is a number literal no larger than ``MAX_EXPONENT``."""
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, (ast.USub, ast.UAdd)):
+        node = node.operand
+    return (
+        isinstance(node, ast.Constant)
+        and isinstance(node.value, (int, float))
+        and not isinstance(node.value, bool)
+        and abs(node.value) <= MAX_EXPONENT
+    )
+
+
+def parse_expression(expression, columns):
+    """Validate ``expression`` against the ``columns`` it may use.
+
+    Returns ``(tree, names)``: the syntax tree with every column replaced by a
+    placeholder name, and the placeholder -> column mapping.
+    """
+    if not expression.strip():
+        raise ExpressionError("The expression is empty.")
+    if len(expression) > MAX_EXPRESSION_LENGTH:
+        raise ExpressionError(f"The expression is longer than {MAX_EXPRESSION_LENGTH} characters.")
+
+    quoted = {}
+
+    def placeholder(match):
+        quoted.setdefault(match.group(1), f"__quoted_{len(quoted)}")
+        return quoted[match.group(1)]
+
+    try:
+        tree = ast.parse(_BACKTICKED.sub(placeholder, expression).strip(), mode="eval")
+    except SyntaxError as exc:
+        raise ExpressionError(f"Invalid expression: {exc.msg}.") from None
+
+    unquoted = {alias: column for column, alias in quoted.items()}
+    columns = set(columns)
+    names = {}
+    for node in ast.walk(tree):
+        if not isinstance(node, ALLOWED_NODES):
+            raise ExpressionError(f"{type(node).__name__} is not allowed in an expression.")
+        if isinstance(node, ast.BinOp) and isinstance(node.op, ast.Pow):
+            # A small literal exponent, and no power of a power
+            nested = any(isinstance(inner, ast.BinOp) and isinstance(inner.op, ast.Pow) for inner in ast.walk(node.left))
+            if not _small_exponent(node.right) or nested:
+                raise ExpressionError(f"Powers need a number up to {MAX_EXPONENT} as exponent, and cannot be nested.")
+        if isinstance(node, ast.Call):
+            if not isinstance(node.func, ast.Name) or node.func.id not in FUNCTIONS or node.keywords:
+                raise ExpressionError(f"Only these functions can be used: {', '.join(sorted(FUNCTIONS))}.")
+            node.func.id = f"__function_{node.func.id}"
+        elif isinstance(node, ast.Constant) and not isinstance(node.value, (int, float, str)):
+            raise ExpressionError(f"The constant {node.value!r} is not allowed.")
+        elif isinstance(node, ast.Name) and not node.id.startswith("__function_"):
+            column = unquoted.get(node.id, node.id)
+            if column not in columns:
+                raise ExpressionError(f"Unknown column {column!r}.")
+            alias = next((alias for alias, name in names.items() if name == column), f"c{len(names)}")
+            names[alias] = column
+            node.id = alias
+
+    # Function names go back to what DataFrame.eval expects
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Call):
+            node.func.id = node.func.id[len("__function_"):]
+    return tree, names
+
+
+def _as_dates(values):
+    """``values`` as datetimes if they are dates (or ISO date strings), else None."""
+    if pd.api.types.is_datetime64_any_dtype(values.dtype):
+        return values
+    if values.notna().any():
+        return parse_iso_dates(values)
+    return None
+
+
+def evaluate(df, expression, columns=None):
+    """Evaluate ``expression`` over ``df``. Returns a Series aligned with ``df``."""
+    tree, names = parse_expression(expression, df.columns if columns is None else columns)
+    scope = {}
+    for alias, column in names.items():
+        dates = _as_dates(df[column])
+        scope[alias] = dates if dates is not None else df[column]
+    scope = pd.DataFrame(scope, index=df.index)
+
+    def kind(node):
+        if isinstance(node, ast.Name):
+            return "date" if pd.api.types.is_datetime64_any_dtype(scope[node.id].dtype) else "other"
+        return "other"
+
+    def run(node):
+        if isinstance(node, ast.Name):
+            return scope[node.id]
+        if isinstance(node, ast.Constant) and not isinstance(node.value, str):
+            return pd.Series(node.value, index=scope.index)
+        return scope.eval(ast.unparse(node))
+
+    class DateArithmetic(ast.NodeTransformer):
+        # Date +/- days and date - date are computed with pandas and put back as a column
+        def visit_BinOp(self, node):
+            self.generic_visit(node)
+            kinds = (kind(node.left), kind(node.right))
+            if "date" not in kinds or not isinstance(node.op, (ast.Add, ast.Sub)):
+                return node
+            left, right = run(node.left), run(node.right)
+            if kinds == ("date", "date") and isinstance(node.op, ast.Sub):
+                result = (left - right) / pd.Timedelta(days=1)
+            elif kinds[0] == "date" and kinds[1] == "other":
+                result = left + pd.to_timedelta(right, unit="D") * (1 if isinstance(node.op, ast.Add) else -1)
+            elif kinds == ("other", "date") and isinstance(node.op, ast.Add):
+                result = right + pd.to_timedelta(left, unit="D")
+            else:
+                raise ExpressionError("Dates can only be added to or subtracted from a number of days.")
+            alias = f"t{len(scope.columns)}"
+            scope[alias] = result
+            return ast.copy_location(ast.Name(id=alias, ctx=ast.Load()), node)
+
+    try:
+        tree = DateArithmetic().visit(tree)
+        result = run(tree.body)
+    except ExpressionError:
+        raise
+    except Exception as exc:
+        raise ExpressionError(f"The expression could not be evaluated: {exc}") from None
+
+    if not isinstance(result, pd.Series) or len(result) != len(df):
+        raise ExpressionError("The expression must give one value per row.")
+    return result.set_axis(df.index)
+
+
+class ComputedColumns:
+    """The computed columns of one session, with their dependency graph and results."""
+
+    def __init__(self):
+        self.columns = {}
+        self.errors = {}
+        self._results = {}
+
+    def define(self, name, expression, base_columns):
+        """Add or replace the column ``name``. Raises ``ExpressionError`` if it is invalid."""
+        name = name.strip()
+        if not name:
+            raise ExpressionError("The column needs a name.")
+        if name in base_columns:
+            raise ExpressionError(f"{name!r} is already a column of the dataset.")
+
+        available = set(base_columns) | set(self.columns)
+        _, names = parse_expression(expression, available - {name})
+        dependencies = tuple(sorted(column for column in names.values() if column in self.columns))
+        if name in self.columns:
+            # A column cannot depend (directly or not) on one that depends on it
+            cycle = set(dependencies) & self.downstream(name)
+            if cycle:
+                raise ExpressionError(f"{name!r} and {sorted(cycle)[0]!r} would depend on each other.")
+        self.columns[name] = ComputedColumn(name, expression.strip(), dependencies)
+
+    def remove(self, name):
+        """Remove ``name`` and every column that depends on it. Returns the removed names."""
+        removed = {name} | self.downstream(name)
+        for column in removed:
+            self.columns.pop(column, None)
+        return sorted(removed)
+
+    def downstream(self, name):
+        """Computed columns that depend on ``name``, directly or through others."""
+        found = set()
+        pending = [name]
+        while pending:
+            current = pending.pop()
+            for column in self.columns.values():
+                if current in column.dependencies and column.name not in found:
+                    found.add(column.name)
+                    pending.append(column.name)
+        return found
+
+    def order(self):
+        """Column names with every column after the ones it depends on."""
+        ordered, placed = [], set()
+        pending = list(self.columns)
+        while pending:
+            ready = [name for name in pending if set(self.columns[name].dependencies) <= placed]
+            if not ready:
+                raise ExpressionError("The computed columns depend on each other in a cycle.")
+            for name in ready:
+                ordered.append(name)
+                placed.add(name)
+                pending.remove(name)
+        return ordered
+
+    def signature(self, name):
+        """The column's expression and those of everything it depends on."""
+        column = self.columns[name]
+        return (column.expression,) + tuple((dependency, self.signature(dependency)) for dependency in column.dependencies)
+
+    def apply(self, df, dataset_version):
+        """Return ``(frame with the computed columns, names recomputed)``.
+
+        Results are cached per (dataset version, column, signature); only
+        columns that are new or downstream of a change are evaluated again.
+        Columns whose expression fails are left out and reported in ``errors``.
+        """
+        values = {}
+        recomputed = []
+        self.errors = {}
+        frame = df
+        for name in self.order():
+            key = (dataset_version, name, self.signature(name))
+            if key not in self._results:
+                if any(dependency in self.errors for dependency in self.columns[name].dependencies):
+                    self.errors[name] = "a column it depends on failed"
+                    continue
+                try:
+                    self._results[key] = evaluate(frame, self.columns[name].expression)
+                except ExpressionError as exc:
+                    self.errors[name] = str(exc)
+                    continue
+                recomputed.append(name)
+            values[name] = self._results[key]
+            frame = frame.assign(**{name: values[name]})
+
+        # Keep only the results still in use, so edits do not pile up in the session
+        live = {(dataset_version, name, self.signature(name)) for name in values}
+        self._results = {key: value for key, value in self._results.items() if key in live}
+        return frame, recomputed
@@ -0,0 +1,196 @@
+"""On-disk snapshot cache for the vehicles dataset.
+
+The raw CSV lives on GitHub, and fetching + parsing it on every cold start is the
+slowest part of booting the app. This module keeps a Parquet snapshot of the last
+download next to a small JSON metadata file (content hash, ETag, Last-Modified),
+revalidates it with a conditional request and reads it back memory-mapped.
+"""
+
+import hashlib
+import io
+import json
+import os
+import time
+import urllib.error
+import urllib.request
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from diagnostics import span
+
+DATA_URL = "https://github.com/olu-fela/sprint4project_webapp/blob/main/vehicles_us.csv?raw=true"
+
+# Local copy of the CSV, used when the snapshot is missing and GitHub is unreachable
+LOCAL_CSV = os.path.join(os.path.dirname(os.path.abspath(__file__)), "vehicles_us.csv")
+
+# Where snapshots are written (override with SNAPSHOT_DIR on Render's persistent disk)
+SNAPSHOT_DIR = os.environ.get(
+    "SNAPSHOT_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache")
+)
+
+# Skip the conditional request entirely if the snapshot was validated this recently
+REVALIDATE_AFTER = int(os.environ.get("SNAPSHOT_REVALIDATE_SECONDS", "3600"))
+
+# Network timeout for the conditional request / download
+FETCH_TIMEOUT = 15
+
+
+def hash_bytes(data):
+    """Return the sha256 hex digest of ``data``."""
+    return hashlib.sha256(data).hexdigest()
+
+
+def _paths(name):
+    return (
+        os.path.join(SNAPSHOT_DIR, f"{name}.parquet"),
+        os.path.join(SNAPSHOT_DIR, f"{name}.json"),
+    )
+
+
+def snapshot_path(name="vehicles_us"):
+    """Path of the Parquet snapshot ``name`` (whether or not it exists)."""
+    return _paths(name)[0]
+
+
+def read_meta(name="vehicles_us"):
+    """Return the stored snapshot metadata, or None if there is no snapshot."""
+    parquet_path, meta_path = _paths(name)
+    if not (os.path.exists(parquet_path) and os.path.exists(meta_path)):
+        return None
+    try:
+        with open(meta_path) as fh:
+            return json.load(fh)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_meta(name, meta):
+    _, meta_path = _paths(name)
+    tmp_path = meta_path + ".tmp"
+    with open(tmp_path, "w") as fh:
+        json.dump(meta, fh, indent=2)
+    os.replace(tmp_path, meta_path)
+
+
+def read_snapshot(name="vehicles_us"):
+    """Read the Parquet snapshot through a memory map."""
+    parquet_path, _ = _paths(name)
+    with span(f"read_snapshot:{name}"):
+        table = pq.read_table(parquet_path, memory_map=True)
+        return table.to_pandas()
+
+
+def write_snapshot(df, meta, name="vehicles_us"):
+    """Write ``df`` as the current snapshot, atomically replacing the old one."""
+    os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+    parquet_path, _ = _paths(name)
+    tmp_path = parquet_path + ".tmp"
+    pq.write_table(pa.Table.from_pandas(df, preserve_index=False), tmp_path)
+    os.replace(tmp_path, parquet_path)
+    _write_meta(name, meta)
+
+
+def _fetch(url, meta):
+    """Conditionally fetch ``url``.
+
+    Returns ``(body, headers)``, or ``(None, headers)`` when the server answers
+    304 Not Modified for the validators stored in ``meta``.
+    """
+    request = urllib.request.Request(url)
+    if meta:
+        if meta.get("etag"):
+            request.add_header("If-None-Match", meta["etag"])
+        if meta.get("last_modified"):
+            request.add_header("If-Modified-Since", meta["last_modified"])
+    try:
+        with urllib.request.urlopen(request, timeout=FETCH_TIMEOUT) as response:
+            return response.read(), response.headers
+    except urllib.error.HTTPError as exc:
+        if exc.code == 304:
+            return None, exc.headers
+        raise
+
+
+def load_snapshot(url=DATA_URL, name="vehicles_us"):
+    """Return ``(df, content_hash)`` for the dataset at ``url``.
+
+    Order of preference:
+    1. the on-disk snapshot, if validated within ``REVALIDATE_AFTER`` seconds
+    2. the on-disk snapshot, if the server says it has not changed (ETag / mtime)
+    3. a fresh download, parsed once and written back as the new snapshot
+    4. the stale snapshot, if the network is down
+    5. the local ``vehicles_us.csv``, if present
+
+    Returns ``(None, None)`` when none of these are available, so the caller can
+    fall back to the file uploader.
+    """
+    meta = read_meta(name)
+
+    # Recently validated snapshot - no network round trip at all
+    if meta and time.time() - meta.get("validated_at", 0) < REVALIDATE_AFTER:
+        return read_snapshot(name), meta["content_hash"]
+
+    try:
+        with span("fetch"):
+            body, headers = _fetch(url, meta)
+    except (urllib.error.URLError, OSError, TimeoutError):
+        body, headers = None, None
+        if meta:
+            # Offline: serve the stale snapshot rather than nothing
+            return read_snapshot(name), meta["content_hash"]
+        if os.path.exists(LOCAL_CSV):
+            with open(LOCAL_CSV, "rb") as fh:
+                body = fh.read()
+            headers = {}
+        else:
+            return None, None
+
+    if body is None:
+        # 304 Not Modified - the snapshot is still current
+        meta["validated_at"] = time.time()
+        _write_meta(name, meta)
+        return read_snapshot(name), meta["content_hash"]
+
+    content_hash = hash_bytes(body)
+    new_meta = {
+        "source": url,
+        "content_hash": content_hash,
+        "etag": headers.get("ETag"),
+        "last_modified": headers.get("Last-Modified"),
+        "validated_at": time.time(),
+    }
+
+    # Same bytes as before (e.g. a server that ignores validators) - skip the parse
+    if meta and meta.get("content_hash") == content_hash:
+        _write_meta(name, new_meta)
+        return read_snapshot(name), content_hash
+
+    with span("parse_csv"):
+        df = pd.read_csv(io.BytesIO(body))
+    try:
+        write_snapshot(df, new_meta, name)
+    except OSError:
+        # Read-only filesystem - still serve the freshly parsed frame
+        pass
+    return df, content_hash
+
+
+def read_cached_frame(name, key):
+    """Return the frame cached under ``name`` if it was stored for ``key``."""
+    meta = read_meta(name)
+    if meta is None or meta.get("key") != key:
+        return None
+    try:
+        return read_snapshot(name)
+    except (OSError, pa.ArrowException):
+        return None
+
+
+def store_cached_frame(name, key, df):
+    """Cache ``df`` on disk under ``name`` for ``key``. Failures are ignored."""
+    try:
+        write_snapshot(df, {"key": key, "written_at": time.time()}, name)
+    except OSError:
+        pass
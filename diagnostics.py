@@ -0,0 +1,298 @@
+"""Runtime diagnostics for the Streamlit apps.
+
+Besides the lazy import timings, this module holds the opt-in per-rerun
+profiler. It is enabled with the ``APP_DIAGNOSTICS=1`` environment variable or
+the ``?diagnostics=1`` query parameter. When it is on, each app wraps its stages
+in ``span(...)`` blocks. Library code (data_cache, preprocessing, chart_registry)
+opens spans of its own through the same function, and those are no-ops when no
+profiler is active for the current rerun.
+
+Each span records its start offset and its duration. With ``APP_DIAGNOSTICS=1``
+it also records the peak Python memory allocated while it ran (tracemalloc).
+Tracing is process-wide and slows every allocation, and its peak is shared by
+concurrent sessions, so the query parameter only turns on the timings. Spans around ``st.cache_data`` functions
+also record whether the call was a cache hit: the cached function reports a miss
+with ``record_miss`` when its body runs. Set ``APP_DIAGNOSTICS_EXPORT`` to a
+file path to write the spans of every rerun there. A ``.prom`` or ``.txt`` path
+gets an OpenMetrics snapshot; any other path gets one JSON line per rerun.
+"""
+
+import contextlib
+import importlib
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+
+import pandas as pd
+
+# Seconds each lazily imported module took to import, in import order
+IMPORT_TIMINGS = {}
+
+# Values of APP_DIAGNOSTICS / ?diagnostics= that turn the profiler on
+ENABLED_VALUES = ("1", "true", "yes", "on")
+
+# Optional export file for the spans of each rerun
+EXPORT_PATH = os.environ.get("APP_DIAGNOSTICS_EXPORT")
+
+# Process-wide cache hit/miss counts: name -> [hits, misses]
+CACHE_STATS = {}
+_cache_lock = threading.Lock()
+
+# Profiler of the rerun running on this thread (Streamlit runs each session on its own thread)
+_local = threading.local()
+
+
+def timed_import(module_name):
+    """Import ``module_name`` on first use and record how long it took.
+
+    Later calls return the already imported module. Modules that were imported
+    elsewhere before their first ``timed_import`` are recorded as 0 seconds.
+    """
+    if module_name in IMPORT_TIMINGS:
+        return sys.modules[module_name]
+
+    already_loaded = module_name in sys.modules
+    start = time.perf_counter()
+    module = importlib.import_module(module_name)
+    IMPORT_TIMINGS[module_name] = 0.0 if already_loaded else time.perf_counter() - start
+    return module
+
+
+def memory_enabled():
+    """Whether memory tracing is switched on (only by the environment)."""
+    return os.environ.get("APP_DIAGNOSTICS", "").lower() in ENABLED_VALUES
+
+
+def enabled(query_params=None):
+    """Whether diagnostics are switched on by the environment or the query string."""
+    if memory_enabled():
+        return True
+    value = (query_params or {}).get("diagnostics", "")
+    return str(value).lower() in ENABLED_VALUES
+
+
+class Profiler:
+    """Spans recorded during one rerun of an app script."""
+
+    def __init__(self, app, trace_memory=False):
+        self.app = app
+        self.trace_memory = trace_memory
+        self.started_at = time.time()
+        self.spans = []
+        self._start = time.perf_counter()
+        self._stack = []
+        self._misses = set()
+        # Tracing is process-wide; with APP_DIAGNOSTICS=1 it stays on for the process
+        if trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    @contextlib.contextmanager
+    def span(self, name, cache=None):
+        """Time the enclosed block. ``cache`` names the cached call it wraps, if any."""
+        if not self.trace_memory:
+            with self._timed_span(name, cache) as record:
+                yield record
+            return
+
+        current, peak = tracemalloc.get_traced_memory()
+        if self._stack:
+            # The parent keeps the peak reached so far; the child measures from here
+            self._stack[-1]["peak"] = max(self._stack[-1]["peak"], peak)
+        tracemalloc.reset_peak()
+        self._misses.discard(cache)
+        record = {
+            "name": name,
+            "depth": len(self._stack),
+            "start": time.perf_counter() - self._start,
+            "seconds": None,
+            "memory_start": current,
+            "peak": current,
+            "cache": None,
+        }
+        self._stack.append(record)
+        try:
+            yield record
+        finally:
+            record["seconds"] = time.perf_counter() - self._start - record["start"]
+            record["peak"] = max(record["peak"], tracemalloc.get_traced_memory()[1])
+            record["peak_bytes"] = record.pop("peak") - record.pop("memory_start")
+            self._stack.pop()
+            if self._stack:
+                self._stack[-1]["peak"] = max(
+                    self._stack[-1]["peak"], record["peak_bytes"] + current
+                )
+            self._finish(record, cache)
+
+    @contextlib.contextmanager
+    def _timed_span(self, name, cache):
+        """``span`` without memory tracing: ``peak_bytes`` is None."""
+        self._misses.discard(cache)
+        record = {
+            "name": name,
+            "depth": len(self._stack),
+            "start": time.perf_counter() - self._start,
+            "seconds": None,
+            "cache": None,
+            "peak_bytes": None,
+        }
+        self._stack.append(record)
+        try:
+            yield record
+        finally:
+            record["seconds"] = time.perf_counter() - self._start - record["start"]
+            self._stack.pop()
+            self._finish(record, cache)
+
+    def _finish(self, record, cache):
+        if cache is not None:
+            hit = cache not in self._misses
+            record["cache"] = "hit" if hit else "miss"
+            with _cache_lock:
+                CACHE_STATS.setdefault(cache, [0, 0])[0 if hit else 1] += 1
+        self.spans.append(record)
+
+    def record_miss(self, cache):
+        self._misses.add(cache)
+
+    def total_seconds(self):
+        return time.perf_counter() - self._start
+
+    def export(self, path=EXPORT_PATH):
+        """Write the spans to ``path``: OpenMetrics for .prom/.txt, else a JSON line."""
+        if not path:
+            return
+        try:
+            if path.endswith((".prom", ".txt")):
+                with open(path + ".tmp", "w") as file:
+                    file.write(self.openmetrics())
+                os.replace(path + ".tmp", path)
+            else:
+                with open(path, "a") as file:
+                    file.write(json.dumps(self.as_dict()) + "\n")
+        except OSError:
+            pass
+
+    def as_dict(self):
+        return {
+            "app": self.app,
+            "started_at": self.started_at,
+            "seconds": self.total_seconds(),
+            "spans": sorted(self.spans, key=lambda span: span["start"]),
+            "cache_stats": cache_stats(),
+        }
+
+    def openmetrics(self):
+        """The last rerun's spans and the cache counters in OpenMetrics text format."""
+        # One sample per stage name: durations add up, the peak is the largest one
+        stages = {}
+        for span in self.spans:
+            seconds, peak = stages.get(span["name"], (0.0, 0))
+            stages[span["name"]] = (seconds + span["seconds"], max(peak, span["peak_bytes"] or 0))
+
+        lines = ["# TYPE app_stage_seconds gauge", "# UNIT app_stage_seconds seconds"]
+        for name, (seconds, _) in stages.items():
+            lines.append(f'app_stage_seconds{{app="{self.app}",stage="{name}"}} {seconds:.6f}')
+        if self.trace_memory:
+            lines += ["# TYPE app_stage_peak_bytes gauge", "# UNIT app_stage_peak_bytes bytes"]
+            for name, (_, peak) in stages.items():
+                lines.append(f'app_stage_peak_bytes{{app="{self.app}",stage="{name}"}} {peak}')
+        lines.append("# TYPE app_cache_requests counter")
+        for name, counts in sorted(cache_stats().items()):
+            lines.append(f'app_cache_requests_total{{cache="{name}",result="hit"}} {counts["hits"]}')
+            lines.append(f'app_cache_requests_total{{cache="{name}",result="miss"}} {counts["misses"]}')
+        lines.append("# EOF")
+        return "\n".join(lines) + "\n"
+
+
+def cache_stats():
+    """Cache hits and misses recorded in this process: name -> {"hits", "misses"}."""
+    with _cache_lock:
+        return {name: {"hits": hits, "misses": misses} for name, (hits, misses) in CACHE_STATS.items()}
+
+
+def start_rerun(app, query_params=None):
+    """Start profiling this rerun if diagnostics are enabled. Returns the profiler or None.
+
+    Memory is only traced when the environment enables diagnostics, never for
+    a ``?diagnostics=1`` visitor.
+    """
+    profiler = Profiler(app, trace_memory=memory_enabled()) if enabled(query_params) else None
+    _local.profiler = profiler
+    return profiler
+
+
+def finish_rerun():
+    """Stop profiling this rerun, export its spans and return the profiler (or None)."""
+    profiler = getattr(_local, "profiler", None)
+    _local.profiler = None
+    if profiler is not None:
+        profiler.export()
+    return profiler
+
+
+def span(name, cache=None):
+    """Context manager timing a stage of the current rerun (no-op when diagnostics are off)."""
+    profiler = getattr(_local, "profiler", None)
+    if profiler is None:
+        return contextlib.nullcontext()
+    return profiler.span(name, cache)
+
+
+def record_miss(cache):
+    """Called from the body of a cached function: the call for ``cache`` was a miss."""
+    profiler = getattr(_local, "profiler", None)
+    if profiler is not None:
+        profiler.record_miss(cache)
+
+
+def waterfall_figure(profiler):
+    """Horizontal bar chart of the rerun's spans, one row per span in start order."""
+    go = timed_import("plotly.graph_objects")
+    spans = sorted(profiler.spans, key=lambda span: span["start"])
+    # Indent nested spans; rows are positions, so repeated names stay separate
+    labels = [
+        "\u00a0" * 4 * span["depth"] + span["name"] + (f" ({span['cache']})" if span["cache"] else "")
+        for span in spans
+    ]
+    fig = go.Figure(
+        go.Bar(
+            y=list(range(len(spans))),
+            x=[span["seconds"] * 1000 for span in spans],
+            base=[span["start"] * 1000 for span in spans],
+            orientation="h",
+            text=labels,
+            customdata=[(span["peak_bytes"] or 0) / 1024 ** 2 for span in spans],
+            hovertemplate="%{text}<br>%{x:.1f} ms"
+            + ("<br>peak %{customdata:.1f} MB" if profiler.trace_memory else "") + "<extra></extra>",
+            textposition="none",
+        )
+    )
+    fig.update_yaxes(tickvals=list(range(len(spans))), ticktext=labels)
+    fig.update_yaxes(autorange="reversed")
+    fig.update_layout(
+        xaxis_title="ms since rerun start",
+        height=120 + 22 * len(spans),
+        margin=dict(l=0, r=0, t=10, b=0),
+    )
+    return fig
+
+
+def diagnostics_panel(container, profiler):
+    """Draw the rerun waterfall and the cache counters in ``container`` (e.g. ``st.sidebar``)."""
+    container.write(f"This rerun: {profiler.total_seconds() * 1000:.0f} ms")
+    if profiler.spans:
+        container.plotly_chart(waterfall_figure(profiler))
+        container.dataframe(
+            pd.DataFrame(sorted(profiler.spans, key=lambda span: span["start"]))
+            .assign(ms=lambda frame: (frame["seconds"] * 1000).round(1),
+                    peak_mb=lambda frame: (frame["peak_bytes"].astype("float64") / 1024 ** 2).round(2))
+            [["name", "ms", "peak_mb", "cache"] if profiler.trace_memory else ["name", "ms", "cache"]],
+            hide_index=True,
+        )
+    stats = cache_stats()
+    if stats:
+        container.write("Cache hits and misses (this process)")
+        container.dataframe(pd.DataFrame(stats).T)
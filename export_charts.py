@@ -0,0 +1,184 @@
+"""Render the charts of app.py to files, without the Streamlit runtime.
+
+The dataset is loaded and cleaned once (with the same snapshot, cache and
+pipeline as app.py), and the aggregate store is built once. Both are handed to
+a pool of worker processes, one chart per task. Each chart is written as
+HTML, PNG and/or JSON under the output directory, with an ``index.html`` that
+links them all:
+
+    python export_charts.py                                  # every chart, all formats
+    python export_charts.py --csv vehicles_us.csv --formats html
+    python export_charts.py --charts sales_by_make price_by_fuel --workers 2
+
+PNG export of plotly charts needs the optional ``kaleido`` package. The seaborn
+charts are PNGs already; they have no JSON form.
+"""
+
+import argparse
+import base64
+import html
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import plotly.io as pio
+
+from backends import BACKENDS, QUERY_BACKEND, aggregate_store
+from chart_registry import CHARTS, CHARTS_BY_ID, missing_columns, render
+from charts import SCATTER_MAX_POINTS
+from data_cache import DATA_URL, load_snapshot
+from ingest import ingest_csv, read_ingested
+from preprocessing import load_clean_data, pipeline_key
+from upload_cache import PREFIX as UPLOAD_PREFIX
+
+FORMATS = ("html", "png", "json")
+
+# Data shared by the charts of a batch, set once per worker process
+_shared = {}
+
+
+def load_dataset(csv_path=None, backend=None):
+    """Return ``(clean frame, aggregates, dataset version)`` like app.py builds them."""
+    if csv_path is None:
+        source = "snapshot"
+        df, data_hash = load_snapshot(DATA_URL)
+        if df is None:
+            raise SystemExit("The dataset could not be downloaded; pass --csv with a local copy.")
+    else:
+        source = "export"
+        with open(csv_path, "rb") as file:
+            # Same prefix as the app's uploads, so UploadCache prunes these files too
+            name, data_hash = ingest_csv(file, prefix=UPLOAD_PREFIX)
+        df = read_ingested(name)
+
+    df = load_clean_data(df, data_hash, source)
+    version = pipeline_key(data_hash)
+    return df, aggregate_store(df, data_hash, backend, source), version
+
+
+def _init_worker(df, aggregates, version):
+    _shared.update(df=df, aggregates=aggregates, version=version)
+
+
+def _html_page(title, body):
+    return (
+        f"<!DOCTYPE html>\n<html>\n<head><meta charset=\"utf-8\"><title>{html.escape(title)}</title></head>\n"
+        f"<body>\n<h2>{html.escape(title)}</h2>\n{body}\n</body>\n</html>\n"
+    )
+
+
+def export_chart(chart_id, formats, output_dir, params=None, offline=False):
+    """Render one chart to ``output_dir``. Returns ``(chart_id, written paths, notes)``."""
+    spec = CHARTS_BY_ID[chart_id]
+    df, aggregates, version = _shared["df"], _shared["aggregates"], _shared["version"]
+    missing = missing_columns(spec, df)
+    if missing:
+        return chart_id, [], [f"skipped: the dataset has no {', '.join(missing)} column"]
+
+    output = render(spec, df, aggregates, version, params)
+    written, notes = [], []
+
+    def path_for(index, extension):
+        suffix = f"_{index + 1}" if len(output) > 1 else ""
+        return os.path.join(output_dir, f"{chart_id}{suffix}.{extension}")
+
+    if spec.kind == "plotly":
+        for index, fig_json in enumerate(output):
+            if "json" in formats:
+                with open(path_for(index, "json"), "w") as file:
+                    file.write(fig_json)
+                written.append(path_for(index, "json"))
+            fig = pio.from_json(fig_json) if {"html", "png"} & set(formats) else None
+            if "html" in formats:
+                fig.update_layout(title_text=fig.layout.title.text or spec.subheader)
+                fig.write_html(path_for(index, "html"), include_plotlyjs=True if offline else "cdn")
+                written.append(path_for(index, "html"))
+            if "png" in formats:
+                try:
+                    fig.write_image(path_for(index, "png"))
+                    written.append(path_for(index, "png"))
+                except (ImportError, ValueError, RuntimeError):
+                    if not notes:
+                        notes.append("png skipped: plotly image export needs kaleido")
+    else:
+        for index, png in enumerate(output):
+            if "png" in formats:
+                with open(path_for(index, "png"), "wb") as file:
+                    file.write(png)
+                written.append(path_for(index, "png"))
+            if "html" in formats:
+                image = base64.b64encode(png).decode()
+                with open(path_for(index, "html"), "w") as file:
+                    file.write(_html_page(spec.subheader, f'<img src="data:image/png;base64,{image}">'))
+                written.append(path_for(index, "html"))
+        if "json" in formats:
+            notes.append("json skipped: static image chart")
+
+    return chart_id, written, notes
+
+
+def write_index(output_dir, results):
+    """Write ``index.html`` linking every exported file, in sidebar order."""
+    items = []
+    for chart_id, written, notes in results:
+        links = " ".join(
+            f'<a href="{html.escape(os.path.basename(path))}">{html.escape(os.path.basename(path))}</a>'
+            for path in written
+        )
+        note = f" <em>{html.escape('; '.join(notes))}</em>" if notes else ""
+        items.append(f"<li>{html.escape(CHARTS_BY_ID[chart_id].label)}: {links}{note}</li>")
+    path = os.path.join(output_dir, "index.html")
+    with open(path, "w") as file:
+        file.write(_html_page("Car Advertisement Data Analysis", "<ul>\n" + "\n".join(items) + "\n</ul>"))
+    return path
+
+
+def export_charts(chart_ids, formats, output_dir, csv_path=None, workers=None, params=None, offline=False,
+                  backend=None):
+    """Export ``chart_ids`` with a pool of ``workers`` processes. Returns the per-chart results."""
+    df, aggregates, version = load_dataset(csv_path, backend)
+    os.makedirs(output_dir, exist_ok=True)
+    workers = workers or min(len(chart_ids), os.cpu_count() or 1)
+    tasks = [(chart_id, formats, output_dir, params, offline) for chart_id in chart_ids]
+
+    if workers <= 1:
+        _init_worker(df, aggregates, version)
+        return [export_chart(*task) for task in tasks]
+
+    # The cleaned frame and aggregates go to each worker once, not once per chart
+    with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(df, aggregates, version)) as pool:
+        futures = [pool.submit(export_chart, *task) for task in tasks]
+        return [future.result() for future in futures]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--charts", nargs="+", choices=[spec.chart_id for spec in CHARTS],
+                        help="chart ids to export (default: all)")
+    parser.add_argument("--formats", nargs="+", choices=FORMATS, default=list(FORMATS))
+    parser.add_argument("--output-dir", default="reports", help="directory for the exported files")
+    parser.add_argument("--csv", help="local CSV to use instead of the published dataset")
+    parser.add_argument("--workers", type=int, help="worker processes (default: one per CPU)")
+    parser.add_argument("--max-points", type=int, default=SCATTER_MAX_POINTS,
+                        help="sample scatter plots above this many rows")
+    parser.add_argument("--offline", action="store_true",
+                        help="embed plotly.js in each HTML file instead of loading it from a CDN")
+    parser.add_argument("--backend", choices=BACKENDS, default=QUERY_BACKEND,
+                        help="execution backend for the aggregate charts")
+    args = parser.parse_args(argv)
+
+    chart_ids = args.charts or [spec.chart_id for spec in CHARTS]
+    results = export_charts(
+        chart_ids, args.formats, args.output_dir, args.csv, args.workers,
+        params={"max_points": args.max_points}, offline=args.offline, backend=args.backend,
+    )
+
+    for chart_id, written, notes in results:
+        print(f"{chart_id}: {len(written)} file(s)" + (f" ({'; '.join(notes)})" if notes else ""))
+    if "html" in args.formats:
+        print(f"Index: {write_index(args.output_dir, results)}")
+    return 0 if all(written for _, written, _ in results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,65 @@
+"""Derived time-bucket columns for the cleaned listings frame.
+
+``add_time_buckets`` runs once per dataset version, as the last step of
+``preprocessing.clean_data``. Each bucket column is an ordered categorical
+computed with integer arithmetic on ``model_year``: the bucket start is
+``year // width * width``. There is no ``pd.cut`` with a fixed list of bins.
+The categories run from the first to the last bucket present in the data, so
+they extend to new model years (2020 and later) without code changes.
+"""
+
+import numpy as np
+import pandas as pd
+
+# Bucket columns derived from model_year: name -> width in years
+TIME_BUCKETS = {
+    "model_year_range": 10,  # decades, used by the decade charts and the aggregate cube
+    "model_year_5y_range": 5,
+    "model_year_1y_range": 1,
+}
+
+
+def bucket_label(start, width):
+    """Label of the bucket starting at ``start``: "2010-2020", or "2015" for 1-year buckets."""
+    return str(start) if width == 1 else f"{start}-{start + width}"
+
+
+def bucket_start(label):
+    """First year of a bucket label (inverse of ``bucket_label``)."""
+    return int(str(label).split("-")[0])
+
+
+def ordered_buckets(values):
+    """Ordered categorical of bucket labels, categories sorted by start year."""
+    values = pd.Series(values, dtype=object)
+    categories = sorted(values.dropna().unique(), key=bucket_start)
+    return pd.Categorical(values, categories=categories, ordered=True)
+
+
+def year_buckets(model_year, width):
+    """Bucket each year into an ordered categorical of ``width``-year ranges."""
+    years = pd.to_numeric(model_year, errors="coerce").to_numpy(dtype="float64", na_value=np.nan)
+    present = ~np.isnan(years)
+    starts = np.zeros(len(years), dtype="int64")
+    starts[present] = years[present].astype("int64") // width * width
+
+    codes = np.full(len(years), -1, dtype="int64")
+    categories = []
+    if present.any():
+        first, last = starts[present].min(), starts[present].max()
+        codes[present] = (starts[present] - first) // width
+        categories = [bucket_label(start, width) for start in range(first, last + 1, width)]
+
+    return pd.Series(
+        pd.Categorical.from_codes(codes, categories=categories, ordered=True),
+        index=model_year.index,
+    )
+
+
+def add_time_buckets(df, buckets=TIME_BUCKETS):
+    """Return ``df`` with the ``buckets`` columns derived from ``model_year``."""
+    if "model_year" not in df.columns:
+        return df
+    return df.assign(**{
+        column: year_buckets(df["model_year"], width) for column, width in buckets.items()
+    })
@@ -0,0 +1,161 @@
+"""Indexed row filters for the sidebar.
+
+``build_index`` is run once per dataset version. For every low-cardinality
+column it stores one packed bitmap (1 bit per row) per value, and for every
+numeric column the row order sorted by value. A filter request then costs a few
+``searchsorted`` calls and bitwise AND/OR over packed bitmaps, instead of
+building boolean masks over the full frame on every widget change.
+"""
+
+import numpy as np
+import pandas as pd
+
+# Columns with more distinct values than this get no bitmap index
+MAX_CATEGORIES = 200
+
+
+def _pack(mask):
+    return np.packbits(mask)
+
+
+def _positions_bitmap(n_rows, positions):
+    mask = np.zeros(n_rows, dtype=bool)
+    mask[positions] = True
+    return _pack(mask)
+
+
+def build_index(df, categorical_columns, range_columns):
+    """Build bitmap and sorted indexes for the given columns of ``df``."""
+    n_rows = len(df)
+    bitmaps = {}
+    for column in categorical_columns:
+        if column not in df.columns:
+            continue
+        codes, values = pd.factorize(df[column], sort=True)
+        if len(values) > MAX_CATEGORIES:
+            continue
+
+        # Group row positions by value code in one sort, then pack each group
+        order = np.argsort(codes, kind="stable")
+        boundaries = np.searchsorted(codes[order], np.arange(len(values) + 1))
+        bitmaps[column] = {
+            value: _positions_bitmap(n_rows, order[boundaries[code]:boundaries[code + 1]])
+            for code, value in enumerate(values)
+        }
+
+    sorted_indexes = {}
+    integer_columns = set()
+    for column in range_columns:
+        if column not in df.columns:
+            continue
+        values = pd.to_numeric(df[column], errors="coerce").to_numpy(dtype="float64", na_value=np.nan)
+        present = np.flatnonzero(~np.isnan(values))
+        order = present[np.argsort(values[present], kind="stable")]
+        sorted_indexes[column] = (values[order], order)
+        if np.array_equal(values[order], np.round(values[order])):
+            integer_columns.add(column)
+
+    return {"n_rows": n_rows, "bitmaps": bitmaps, "sorted": sorted_indexes, "integer": integer_columns}
+
+
+def value_options(index, column):
+    """Distinct values of an indexed categorical column."""
+    return list(index["bitmaps"][column])
+
+
+def value_range(index, column):
+    """``(min, max)`` of an indexed numeric column, or None if it is empty."""
+    sorted_values, _ = index["sorted"][column]
+    if len(sorted_values) == 0:
+        return None
+    return sorted_values[0], sorted_values[-1]
+
+
+def filter_bitmap(index, selections=None, ranges=None):
+    """Packed bitmap of the rows matching every filter, or None if no filter is set.
+
+    ``selections`` maps a categorical column to the values to keep (empty means
+    no filter). ``ranges`` maps a numeric column to an inclusive ``(low, high)``.
+    """
+    n_rows = index["n_rows"]
+    result = None
+
+    for column, values in (selections or {}).items():
+        if not values:
+            continue
+        column_bitmaps = index["bitmaps"][column]
+        bits = np.zeros((n_rows + 7) // 8, dtype=np.uint8)
+        for value in values:
+            if value in column_bitmaps:
+                bits |= column_bitmaps[value]
+        result = bits if result is None else result & bits
+
+    for column, (low, high) in (ranges or {}).items():
+        sorted_values, order = index["sorted"][column]
+        start = np.searchsorted(sorted_values, low, side="left")
+        stop = np.searchsorted(sorted_values, high, side="right")
+        bits = _positions_bitmap(n_rows, order[start:stop])
+        result = bits if result is None else result & bits
+
+    return result
+
+
+def filter_rows(index, selections=None, ranges=None):
+    """Row positions matching the filters, or None if no filter is set."""
+    bits = filter_bitmap(index, selections, ranges)
+    if bits is None:
+        return None
+    return np.flatnonzero(np.unpackbits(bits, count=index["n_rows"]))
+
+
+def filter_key(selections=None, ranges=None):
+    """Stable, hashable description of the active filters (for cache keys)."""
+    active_selections = tuple(
+        (column, tuple(sorted(map(str, values))))
+        for column, values in sorted((selections or {}).items())
+        if values
+    )
+    active_ranges = tuple(
+        (column, (float(low), float(high)))
+        for column, (low, high) in sorted((ranges or {}).items())
+    )
+    return active_selections, active_ranges
+
+
+def filter_sidebar(container, index, categorical_columns, range_columns):
+    """Draw filter widgets in ``container`` (e.g. ``st.sidebar``).
+
+    Returns ``(selections, ranges)`` for ``filter_rows``. Range sliders left at
+    their full extent are not returned, so rows with missing values are kept.
+    """
+    selections = {}
+    for column in categorical_columns:
+        if column in index["bitmaps"]:
+            selections[column] = container.multiselect(
+                column.replace("_", " ").capitalize(),
+                value_options(index, column),
+                key=f"filter_{column}",
+            )
+
+    ranges = {}
+    for column in range_columns:
+        if column not in index["sorted"]:
+            continue
+        extent = value_range(index, column)
+        if extent is None:
+            continue
+        low, high = (float(value) for value in extent)
+        if low == high:
+            continue
+        chosen = container.slider(
+            column.replace("_", " ").capitalize(),
+            min_value=low,
+            max_value=high,
+            value=(low, high),
+            step=1.0 if column in index["integer"] else None,
+            key=f"filter_{column}",
+        )
+        if chosen != (low, high):
+            ranges[column] = chosen
+
+    return selections, ranges
@@ -0,0 +1,68 @@
+"""Group-wise imputation rules for the vehicles dataset.
+
+Each rule fills the missing values of one column with a statistic of that column
+computed within groups (e.g. the median cylinders per model and model year).
+Rules run through ``groupby(...).transform`` so the group statistic is broadcast
+straight back onto the rows - no intermediate grouped table, merge or helper column.
+"""
+
+from collections import namedtuple
+
+from diagnostics import span
+from sketches import group_quantile, use_sketches
+
+ImputationRule = namedtuple(
+    "ImputationRule", ["column", "by", "statistic", "dropna", "round"]
+)
+ImputationRule.__new__.__defaults__ = (True, False)
+
+# Rules applied by preprocessing.clean_data, in order
+DEFAULT_RULES = [
+    # Median cylinders for the same model and model year, rounded to a whole number
+    ImputationRule("cylinders", ("model", "model_year"), "median", round=True),
+    # Mean odometer for cars that share year, model, fuel, transmission, type and drive
+    ImputationRule(
+        "odometer",
+        ("model_year", "model", "fuel", "transmission", "type", "is_4wd"),
+        "mean",
+        dropna=False,
+    ),
+]
+
+
+def impute(df, rules=DEFAULT_RULES, engine=None):
+    """Apply ``rules`` to ``df`` in place.
+
+    Median rules use mergeable quantile sketches instead of an exact per-group
+    sort when ``engine`` (default: ``sketches.QUANTILE_ENGINE``) is ``"sketch"``.
+
+    Returns ``(df, report)`` where ``report`` maps each rule's column to the
+    number of cells it filled. Rules whose column or group keys are missing from
+    ``df`` are skipped and left out of the report.
+    """
+    report = {}
+    for rule in rules:
+        if rule.column not in df.columns or any(key not in df.columns for key in rule.by):
+            continue
+
+        missing = df[rule.column].isna()
+        if not missing.any():
+            report[rule.column] = 0
+            continue
+
+        with span(f"impute:{rule.column}"):
+            # Group statistic broadcast back to every row of the group
+            if rule.statistic == "median" and use_sketches(engine):
+                fill = group_quantile(df, rule.by, rule.column, 0.5, dropna=rule.dropna)
+            else:
+                fill = (
+                    df.groupby(list(rule.by), dropna=rule.dropna, observed=True, sort=False)[rule.column]
+                    .transform(rule.statistic)
+                )
+            if rule.round:
+                fill = fill.round()
+
+            df[rule.column] = df[rule.column].fillna(fill)
+        report[rule.column] = int((missing & df[rule.column].notna()).sum())
+
+    return df, report
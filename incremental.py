@@ -0,0 +1,279 @@
+"""Incremental refresh of the cleaned listings frame.
+
+A full rebuild re-cleans every listing and recomputes every group statistic.
+When a new snapshot of the feed arrives, most of its rows are unchanged, so
+``apply_changes`` only processes the rows that are new or whose content changed
+(and, for a full snapshot, drops listings that disappeared):
+
+* listings are matched on an identity hash (a ``listing_id``/``id`` column if
+  the feed has one, else the columns that describe the vehicle and the posting)
+* the imputation statistics are kept as mergeable partial aggregates
+  (sum/count for means, value counts for medians), updated by the delta
+* only the imputed cells in groups touched by the delta are refilled
+* the aggregate store is updated with ``aggregates.update_aggregates``
+
+The result matches a full rebuild apart from row order: changed and new rows
+are appended at the end. The state records the raw columns and dtypes it was
+built from; a frame with other columns needs a full rebuild.
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from aggregates import build_aggregates, update_aggregates
+from data_cache import SNAPSHOT_DIR
+from features import TIME_BUCKETS, add_time_buckets
+from imputation import DEFAULT_RULES
+
+# Columns that identify a listing when the feed has an explicit id
+ID_COLUMNS = ("listing_id", "id")
+
+# Columns that identify a listing otherwise (price and days_listed may change)
+IDENTITY_COLUMNS = [
+    "date_posted", "model", "model_year", "condition", "cylinders", "fuel",
+    "odometer", "transmission", "type", "paint_color", "is_4wd",
+]
+
+
+
+def _hash_rows(df):
+    return pd.util.hash_pandas_object(df, index=False).to_numpy()
+
+
+def _column_hashes(df):
+    """One uint64 hash per cell. Text columns are hashed once per distinct value."""
+    hashes = {}
+    for column in df.columns:
+        values = df[column]
+        if values.dtype == object or pd.api.types.is_string_dtype(values.dtype):
+            array = pa.array(values, from_pandas=True)
+            if isinstance(array, pa.ChunkedArray):
+                array = array.combine_chunks()
+            encoded = pc.dictionary_encode(array)
+            distinct = _hash_rows(encoded.dictionary.to_pandas().astype(object))
+            codes = encoded.indices.fill_null(-1).to_numpy()
+            # Missing values (code -1) all hash to 0
+            hashes[column] = np.where(codes >= 0, distinct.take(codes), 0)
+        else:
+            hashes[column] = _hash_rows(values.to_frame())
+    return pd.DataFrame(hashes)
+
+
+def listing_ids(raw, column_hashes=None):
+    """Identity hash per raw row. Repeated identical listings get distinct ids."""
+    id_columns = [column for column in ID_COLUMNS if column in raw.columns][:1]
+    columns = id_columns or [column for column in IDENTITY_COLUMNS if column in raw.columns]
+    if column_hashes is None:
+        column_hashes = _column_hashes(raw[columns])
+    base = _hash_rows(column_hashes[columns])
+    occurrence = pd.Series(base).groupby(base).cumcount().to_numpy()
+    return _hash_rows(pd.DataFrame({"id": base, "occurrence": occurrence}))
+
+
+def row_hashes(raw, column_hashes=None):
+    """Content hash per raw row, used to detect changed listings."""
+    if column_hashes is None:
+        column_hashes = _column_hashes(raw)
+    return _hash_rows(column_hashes[list(raw.columns)])
+
+
+def _group_keys(df, rule):
+    """Group hash per row, and whether the row takes part in the rule's groups."""
+    keys = df[list(rule.by)]
+    in_group = np.ones(len(df), dtype=bool)
+    if rule.dropna:
+        in_group = keys.notna().all(axis=1).to_numpy()
+    return _hash_rows(keys), in_group
+
+
+def _rule_stats(df, rule, imputed):
+    """Partial aggregates of the observed (non-imputed) values for ``rule``."""
+    groups, in_group = _group_keys(df, rule)
+    values = df[rule.column].to_numpy(dtype="float64", na_value=np.nan)
+    observed = in_group & ~imputed & ~np.isnan(values)
+    frame = pd.DataFrame({"group": groups[observed], "value": values[observed], "count": 1})
+    if rule.statistic == "mean":
+        return frame.groupby("group")[["value", "count"]].sum()
+    # Value counts per group - exact, mergeable medians for discrete columns
+    return frame.groupby(["group", "value"])[["count"]].sum()
+
+
+def _merge_stats(stats, delta, sign):
+    if delta.empty:
+        return stats
+    merged = stats.add(delta * sign, fill_value=0)
+    return merged[merged["count"] > 0]
+
+
+def _fill_values(stats, rule, groups):
+    """The rule's statistic for each group in ``groups`` (a Series indexed by group)."""
+    if rule.statistic == "mean":
+        subset = stats.reindex(groups)
+        return subset["value"] / subset["count"]
+
+    table = stats[stats.index.get_level_values("group").isin(groups)].reset_index()
+    table = table.sort_values(["group", "value"])
+    running = table.groupby("group")["count"].cumsum()
+    total = table.groupby("group")["count"].transform("sum")
+    # Middle positions (0-based); they differ for an even number of values
+    lower = table[running > (total - 1) // 2].groupby("group")["value"].first()
+    upper = table[running > total // 2].groupby("group")["value"].first()
+    return ((lower + upper) / 2).reindex(groups)
+
+
+def raw_columns(raw):
+    """The raw frame's column names and dtypes, as stored in the incremental state."""
+    return [(column, str(dtype)) for column, dtype in raw.dtypes.items()]
+
+
+def raw_identity(raw, rules=DEFAULT_RULES):
+    """Listing ids, content hashes and missing-value flags of a raw frame."""
+    column_hashes = _column_hashes(raw)
+    return {
+        "raw_columns": raw_columns(raw),
+        "ids": listing_ids(raw, column_hashes),
+        "row_hashes": row_hashes(raw, column_hashes),
+        "imputed": {rule.column: raw[rule.column].isna().to_numpy() for rule in rules if rule.column in raw.columns},
+    }
+
+
+def build_state(identity, clean, rules=DEFAULT_RULES):
+    """Incremental state for ``clean``, the full rebuild of the raw frame behind ``identity``."""
+    imputed = identity["imputed"]
+    return dict(
+        identity,
+        stats={
+            rule.column: _rule_stats(clean, rule, imputed[rule.column])
+            for rule in rules
+            if rule.column in imputed
+        },
+        aggregates=build_aggregates(clean),
+    )
+
+
+def _concat_clean(kept, added):
+    """Concatenate two cleaned frames, keeping categorical columns categorical."""
+    for column in kept.columns:
+        if isinstance(kept[column].dtype, pd.CategoricalDtype) and column in added.columns:
+            new_values = pd.Index(added[column].cat.categories).difference(kept[column].cat.categories)
+            # Appending categories keeps the codes, so this does not touch the old rows
+            kept[column] = kept[column].cat.add_categories(new_values)
+            added[column] = added[column].cat.set_categories(kept[column].cat.categories)
+    return pd.concat([kept, added], ignore_index=True)
+
+
+def apply_changes(clean, state, raw, clean_rows, full_snapshot=True, rules=DEFAULT_RULES):
+    """Bring ``clean`` up to date with ``raw``, processing only the changed rows.
+
+    ``raw`` is either the full new snapshot (``full_snapshot=True``: listings no
+    longer present are dropped) or just the new/changed rows. ``clean_rows`` is
+    the row-local cleaning step (``preprocessing.clean_rows``).
+
+    Returns ``(clean, state, summary)``. Raises ``ValueError`` if ``raw`` does
+    not have the columns and dtypes ``state`` was built from.
+    """
+    if state.get("raw_columns") != raw_columns(raw):
+        raise ValueError("The raw columns differ from the ones the state was built from; rebuild with clean_data.")
+    identity = raw_identity(raw, rules)
+    ids = identity["ids"]
+    hashes = identity["row_hashes"]
+
+    old_index = pd.Index(state["ids"])
+    positions = old_index.get_indexer(ids)
+    known = positions >= 0
+    unchanged = known & (state["row_hashes"][np.where(known, positions, 0)] == hashes)
+
+    # Old rows to drop: changed ones, and (for a full snapshot) ones that disappeared
+    drop = np.zeros(len(clean), dtype=bool)
+    drop[positions[known & ~unchanged]] = True
+    if full_snapshot:
+        drop |= ~old_index.isin(ids)
+
+    delta = ~unchanged
+    added = clean_rows(raw[delta].reset_index(drop=True))
+    removed = clean[drop]
+    removed_imputed = {column: flags[drop] for column, flags in state["imputed"].items()}
+    added_imputed = {column: flags[delta] for column, flags in identity["imputed"].items()}
+
+    # Bucket categories follow the data's year range, so they are derived for the whole new frame
+    kept = clean[~drop].drop(columns=list(TIME_BUCKETS), errors="ignore").reset_index(drop=True)
+    new_clean = add_time_buckets(_concat_clean(kept, added))
+    imputed = {
+        column: np.concatenate([flags[~drop], added_imputed[column]])
+        for column, flags in state["imputed"].items()
+    }
+
+    report = {}
+    stats = {}
+    for rule in rules:
+        if rule.column not in state["stats"]:
+            continue
+        column_stats = state["stats"][rule.column]
+        column_stats = _merge_stats(column_stats, _rule_stats(removed, rule, removed_imputed[rule.column]), -1)
+        column_stats = _merge_stats(column_stats, _rule_stats(added, rule, added_imputed[rule.column]), 1)
+        stats[rule.column] = column_stats
+
+        # Refill the imputed cells of every group the change touched
+        touched = np.union1d(_group_keys(removed, rule)[0], _group_keys(added, rule)[0])
+        groups, in_group = _group_keys(new_clean, rule)
+        refill = np.flatnonzero(imputed[rule.column] & np.isin(groups, touched))
+        values = _fill_values(column_stats, rule, groups[refill]).to_numpy(dtype="float64", copy=True)
+        values[~in_group[refill]] = np.nan
+        if rule.round:
+            values = np.round(values)
+        column = new_clean[rule.column].copy()
+        column.iloc[refill] = pd.array(values).astype(column.dtype)
+        new_clean[rule.column] = column
+        report[rule.column] = int(new_clean[rule.column].notna().to_numpy()[imputed[rule.column]].sum())
+
+    new_clean.attrs = dict(clean.attrs)
+    new_clean.attrs["imputation_report"] = report
+
+    new_state = {
+        "raw_columns": identity["raw_columns"],
+        "ids": np.concatenate([state["ids"][~drop], ids[delta]]),
+        "row_hashes": np.concatenate([state["row_hashes"][~drop], hashes[delta]]),
+        "imputed": imputed,
+        "stats": stats,
+        "aggregates": update_aggregates(state["aggregates"], new_clean, added=added, removed=removed),
+    }
+    summary = {"added": int(delta.sum() - (known & ~unchanged).sum()),
+               "changed": int((known & ~unchanged).sum()),
+               "removed": int(drop.sum() - (known & ~unchanged).sum()),
+               "unchanged": int(unchanged.sum())}
+    return new_clean, new_state, summary
+
+
+def _state_path(name):
+    return os.path.join(SNAPSHOT_DIR, f"{name}.state.pkl")
+
+
+def load_aggregates(name, key):
+    """Aggregate store kept in the incremental state of snapshot ``name`` for ``key``, or None."""
+    state = load_state(name, key)
+    return None if state is None else state["aggregates"]
+
+
+def load_state(name, key):
+    """Incremental state saved with the cleaned frame ``name`` for ``key``, or None."""
+    path = _state_path(name)
+    try:
+        saved = pd.read_pickle(path)
+    except (OSError, ValueError, EOFError):
+        return None
+    return saved["state"] if saved.get("key") == key else None
+
+
+def save_state(name, key, state):
+    """Persist the incremental state of the cleaned frame ``name`` for ``key``."""
+    path = _state_path(name)
+    try:
+        os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+        pd.to_pickle({"key": key, "state": state}, path + ".tmp")
+        os.replace(path + ".tmp", path)
+    except OSError:
+        pass
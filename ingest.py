@@ -0,0 +1,202 @@
+"""Streaming CSV ingestion into the on-disk columnar store.
+
+Large dealer exports do not fit comfortably in a worker when parsed in one go
+(raw text, Python objects and the final frame all alive at once). ``ingest_csv``
+infers column types from a small sample, then streams the file through
+``pyarrow.csv`` one block at a time, appending each block to a Parquet file.
+The raw text is never held in memory as a whole; peak memory is bounded by the
+block size. The content hash is computed on the same pass.
+
+The sample can miss values further down the file (text in a numeric column, a
+column that is blank for the first rows). When a block does not convert, the
+failing column is widened (int64 -> float64 -> string) and the file is
+streamed again, so every CSV ``pd.read_csv`` accepts is ingested.
+"""
+
+import hashlib
+import os
+import re
+import tempfile
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pacsv
+import pyarrow.parquet as pq
+
+from data_cache import SNAPSHOT_DIR, read_snapshot
+
+# Bytes parsed per block
+BLOCK_SIZE = 16 * 1024 * 1024
+
+# Rows read up front to infer column types
+SAMPLE_ROWS = 10_000
+
+# Type a column is widened to when a value does not convert to its current type
+WIDER_TYPES = {pa.int64(): pa.float64(), pa.float64(): pa.string(), pa.bool_(): pa.string()}
+
+# Cells read as missing, the same ones as pd.read_csv's default na_values
+NULL_VALUES = [
+    "", "#N/A", "#N/A N/A", "#NA", "-1.#IND", "-1.#QNAN", "-NaN", "-nan", "1.#IND", "1.#QNAN",
+    "<NA>", "N/A", "NA", "NULL", "NaN", "None", "n/a", "nan", "null",
+]
+
+_FAILED_COLUMN = re.compile(r"CSV column #(\d+)")
+
+
+class HashingReader:
+    """File wrapper that hashes and counts the bytes read through it."""
+
+    def __init__(self, raw):
+        self.raw = raw
+        self.bytes_read = 0
+        self.sha256 = hashlib.sha256()
+
+    def read(self, size=-1):
+        data = self.raw.read(size)
+        self.sha256.update(data)
+        self.bytes_read += len(data)
+        return data
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return False
+
+    @property
+    def closed(self):
+        return False
+
+    def close(self):
+        pass
+
+
+def _size_of(source):
+    """Size in bytes of a seekable file object, or None."""
+    size = getattr(source, "size", None)
+    if size is not None:
+        return size
+    try:
+        position = source.tell()
+        source.seek(0, os.SEEK_END)
+        size = source.tell()
+        source.seek(position)
+        return size
+    except (AttributeError, OSError):
+        return None
+
+
+def infer_column_types(source, sample_rows=SAMPLE_ROWS):
+    """Arrow column types for ``source``, inferred from its first rows.
+
+    Integer columns without missing values in the sample stay int64 (a missing
+    value further down makes them float64 when read back, as with
+    ``pd.read_csv``); other numeric columns become float64 and everything else
+    is read as text.
+    """
+    sample = pd.read_csv(source, nrows=sample_rows)
+    source.seek(0)
+
+    column_types = {}
+    for column, dtype in sample.dtypes.items():
+        if pd.api.types.is_bool_dtype(dtype):
+            column_types[column] = pa.bool_()
+        elif pd.api.types.is_integer_dtype(dtype):
+            column_types[column] = pa.int64()
+        elif pd.api.types.is_numeric_dtype(dtype):
+            column_types[column] = pa.float64()
+        else:
+            column_types[column] = pa.string()
+    return column_types
+
+
+def snapshot_name(prefix, content_hash):
+    """Name of the ingested snapshot for a file with ``content_hash``."""
+    return f"{prefix}_{content_hash[:16]}"
+
+
+def _widen(column_types, error):
+    """Widen the column named in a CSV conversion ``error``. Returns False if there is none."""
+    match = _FAILED_COLUMN.search(str(error))
+    if match is None or int(match.group(1)) >= len(column_types):
+        return False
+    column = list(column_types)[int(match.group(1))]
+    wider = WIDER_TYPES.get(column_types[column])
+    if wider is None:
+        return False
+    column_types[column] = wider
+    return True
+
+
+def _stream(source, column_types, path, block_size, progress, total_size):
+    """Stream ``source`` into the Parquet file ``path``. Returns the ``HashingReader`` used."""
+    reader = HashingReader(source)
+    batches = pacsv.open_csv(
+        reader,
+        read_options=pacsv.ReadOptions(block_size=block_size),
+        # Blank and NA-like text cells are missing values, as with pd.read_csv
+        convert_options=pacsv.ConvertOptions(
+            column_types=column_types,
+            null_values=NULL_VALUES,
+            strings_can_be_null=True,
+            quoted_strings_can_be_null=True,
+        ),
+    )
+
+    writer = None
+    try:
+        for batch in batches:
+            if writer is None:
+                writer = pq.ParquetWriter(path, batch.schema)
+            writer.write_table(pa.Table.from_batches([batch]))
+            # Report from this thread - pyarrow reads ahead on its own threads
+            if progress is not None and total_size:
+                progress(min(reader.bytes_read / total_size, 1.0))
+        if writer is None:
+            # Header-only file
+            writer = pq.ParquetWriter(path, batches.schema)
+    finally:
+        if writer is not None:
+            writer.close()
+    return reader
+
+
+def ingest_csv(source, prefix="upload", progress=None, block_size=BLOCK_SIZE, sample_rows=SAMPLE_ROWS):
+    """Stream the CSV in ``source`` into a Parquet file in ``SNAPSHOT_DIR``.
+
+    ``progress`` is called with the fraction of the file read so far. Returns
+    ``(name, content_hash)``, where ``name`` identifies the snapshot for
+    ``read_ingested`` and is derived from the content hash.
+    """
+    column_types = infer_column_types(source, sample_rows)
+    total_size = _size_of(source)
+
+    os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+    # Unique temp file, so concurrent sessions ingesting at once do not collide
+    fd, tmp_path = tempfile.mkstemp(prefix=f"{prefix}.", suffix=".ingest.tmp", dir=SNAPSHOT_DIR)
+    os.close(fd)
+    try:
+        while True:
+            try:
+                reader = _stream(source, column_types, tmp_path, block_size, progress, total_size)
+                break
+            except pa.ArrowInvalid as exc:
+                # A value the sample did not show: widen its column and read the file again
+                if not _widen(column_types, exc):
+                    raise
+                source.seek(0)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+    content_hash = reader.sha256.hexdigest()
+    name = snapshot_name(prefix, content_hash)
+    os.replace(tmp_path, os.path.join(SNAPSHOT_DIR, f"{name}.parquet"))
+    if progress is not None:
+        progress(1.0)
+    return name, content_hash
+
+
+def read_ingested(name):
+    """Load an ingested upload back as a DataFrame (memory-mapped read)."""
+    return read_snapshot(name)
@@ -0,0 +1,89 @@
+"""Parsing of the ``model`` column into a canonical make and model type.
+
+The dataset has a few hundred distinct ``model`` strings over many rows, so
+each distinct string is parsed once and the result is broadcast back to the
+rows through its factorized code. Makes are normalized (lower case, aliases
+such as "chevy" folded into "chevrolet") and returned as categoricals. Makes of
+more than one word ("land rover range rover") are matched as a prefix before
+the rest of the string is split off.
+"""
+
+import pandas as pd
+
+# Alternative spellings of a make, mapped to the canonical name
+MAKE_ALIASES = {
+    "chevy": "chevrolet",
+    "vw": "volkswagen",
+    "mercedes": "mercedes-benz",
+    "benz": "mercedes-benz",
+    "landrover": "land rover",
+    "alfa": "alfa romeo",
+}
+
+# Makes whose name contains a space, matched before splitting on the first space
+MULTI_WORD_MAKES = ("alfa romeo", "aston martin", "land rover")
+
+# Display names for makes that are not simply capitalized
+MAKE_DISPLAY_NAMES = {
+    "bmw": "BMW",
+    "gmc": "GMC",
+    "mercedes-benz": "Mercedes-Benz",
+    "land rover": "Land Rover",
+    "alfa romeo": "Alfa Romeo",
+    "aston martin": "Aston Martin",
+}
+
+
+def canonical_make(make):
+    """Normalized make name for a raw make token."""
+    make = make.strip().lower()
+    return MAKE_ALIASES.get(make, make)
+
+
+def display_make(make):
+    """Name of ``make`` as shown in charts."""
+    return MAKE_DISPLAY_NAMES.get(make, make.capitalize())
+
+
+def split_model(model):
+    """Split a model string into its raw make and the model type."""
+    model = str(model).strip()
+    lowered = model.lower()
+    for make in MULTI_WORD_MAKES:
+        if lowered == make or lowered.startswith(make + " "):
+            return model[:len(make)], model[len(make):]
+    make, _, model_type = model.partition(" ")
+    return make, model_type
+
+
+def model_dictionary(models):
+    """Parse each distinct model string once.
+
+    Returns a frame indexed by the distinct model strings with ``make`` and
+    ``model_type`` columns.
+    """
+    rows = {}
+    for model in models:
+        make, model_type = split_model(model)
+        rows[model] = (canonical_make(make), model_type.strip() or None)
+    return pd.DataFrame.from_dict(rows, orient="index", columns=["make", "model_type"])
+
+
+def parse_models(model):
+    """Split a ``model`` series into categorical ``make`` and ``model_type`` series."""
+    codes, uniques = pd.factorize(model)
+    dictionary = model_dictionary(uniques)
+
+    columns = {}
+    for column in ("make", "model_type"):
+        # Map each distinct model to a code in the (deduplicated) output categories
+        value_codes, categories = pd.factorize(dictionary[column], sort=True)
+        # Missing models (code -1) stay missing
+        row_codes = value_codes.take(codes)
+        row_codes[codes < 0] = -1
+        columns[column] = pd.Series(
+            pd.Categorical.from_codes(row_codes, categories=categories),
+            index=model.index,
+            name=column,
+        )
+    return columns["make"], columns["model_type"]
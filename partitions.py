@@ -0,0 +1,177 @@
+"""Partitioned, multi-process execution of ``preprocessing.clean_data``.
+
+The raw listings are hash-partitioned on ``model``, and every partition is
+written as one record batch of an Arrow IPC file in shared memory (``/dev/shm``
+where available). Worker processes memory-map that file, so they read their
+batch without it being pickled. Each worker runs the row-local cleaning
+(``clean_rows``) on its partition.
+
+Every default imputation rule groups by ``model``, so all the rows of an
+imputation group fall in the same partition and the worker imputes them
+itself, with the same code as the serial path. For a rule that does not group
+by the partition column, the workers return partial aggregates instead
+(sum/count for means, value counts for medians, the same ones incremental.py
+keeps). The parent merges them and fills the missing values.
+
+The parent then concatenates the partitions in the original row order, unifies
+the categories of the categorical columns and derives the time buckets. The
+result matches the serial ``clean_data``: the same values, dtypes, categories,
+index and imputation report. Only the memory report differs slightly, since it
+adds up the per-partition figures (each partition stores its own categories).
+"""
+
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from diagnostics import span
+from features import add_time_buckets
+from imputation import DEFAULT_RULES, impute
+from incremental import _fill_values, _group_keys, _rule_stats
+
+# Column the listings are partitioned on (every default imputation rule groups by it)
+PARTITION_COLUMN = "model"
+
+# Frames smaller than this are cleaned serially; the pool costs more than it saves
+MIN_PARALLEL_ROWS = 100_000
+
+# Shared memory for the partition file, if the platform has it
+SHM_DIR = "/dev/shm" if os.path.isdir("/dev/shm") else None
+
+
+def partition_codes(df, n_partitions, column=PARTITION_COLUMN):
+    """Partition number of each row: equal ``column`` values share a partition."""
+    if column not in df.columns:
+        return np.arange(len(df)) % n_partitions
+    codes, _ = pd.factorize(df[column])
+    # Missing values (code -1) go to the first partition, as one group
+    return np.where(codes >= 0, codes % n_partitions, 0)
+
+
+def _local_rules(rules, column=PARTITION_COLUMN):
+    """Rules whose groups never span partitions, and the ones that need merged statistics.
+
+    Merged rules run after the local ones, so if a rule reads a column another
+    rule fills, every rule runs in the parent instead, in order.
+    """
+    filled = {rule.column for rule in rules}
+    if any(filled & set(rule.by) for rule in rules):
+        return [], []
+    local = [rule for rule in rules if column in rule.by]
+    merged = [rule for rule in rules if column not in rule.by]
+    return local, merged
+
+
+def _write_partitions(df, codes, n_partitions, path):
+    """Write the rows of each partition as one record batch. Returns the row order used."""
+    order = np.argsort(codes, kind="stable")
+    bounds = np.searchsorted(codes[order], np.arange(n_partitions + 1))
+    table = pa.Table.from_pandas(df.iloc[order], preserve_index=False)
+    with pa.OSFile(path, "wb") as sink, pa.ipc.new_file(sink, table.schema) as writer:
+        for start, stop in zip(bounds[:-1], bounds[1:]):
+            writer.write_batch(table.slice(start, stop - start).combine_chunks().to_batches()[0]
+                               if stop > start else pa.RecordBatch.from_pylist([], schema=table.schema))
+    return order
+
+
+def clean_partition(path, index, clean_rows, rules=DEFAULT_RULES):
+    """Worker task: clean partition ``index`` of the partition file at ``path``.
+
+    Returns ``(frame, imputation report, memory report, partial statistics)``.
+    """
+    with pa.memory_map(path) as source:
+        df = pa.ipc.open_file(source).get_batch(index).to_pandas()
+
+    df = clean_rows(df)
+    local, merged = _local_rules(rules)
+    df, report = impute(df, local) if local else (df, {})
+    stats = {
+        rule.column: _rule_stats(df, rule, np.zeros(len(df), dtype=bool))
+        for rule in merged
+        if rule.column in df.columns and all(key in df.columns for key in rule.by)
+    }
+    return df, report, df.attrs.get("memory_report", {}), stats
+
+
+def _concat_partitions(frames):
+    """Concatenate cleaned partitions, giving each categorical the sorted union of categories."""
+    columns = {}
+    for column in frames[0].columns:
+        parts = [frame[column] for frame in frames]
+        if isinstance(parts[0].dtype, pd.CategoricalDtype):
+            # Like astype("category") on the whole column: sorted categories of the values present
+            categories = pd.Index(np.concatenate([part.cat.categories.to_numpy() for part in parts]))
+            categories = categories.unique().sort_values()
+            columns[column] = pd.concat([part.cat.set_categories(categories) for part in parts], ignore_index=True)
+        else:
+            columns[column] = pd.concat(parts, ignore_index=True)
+    return pd.DataFrame(columns)
+
+
+def _impute_merged(df, rule, partials):
+    """Fill ``rule`` from the workers' partial statistics. Returns the cells filled."""
+    missing = df[rule.column].isna().to_numpy()
+    if not missing.any():
+        return 0
+    stats = pd.concat(partials).groupby(level=list(range(partials[0].index.nlevels))).sum()
+    groups, in_group = _group_keys(df, rule)
+    rows = np.flatnonzero(missing & in_group)
+    values = _fill_values(stats, rule, groups[rows]).to_numpy(dtype="float64", copy=True)
+    if rule.round:
+        values = np.round(values)
+    column = df[rule.column].copy()
+    column.iloc[rows] = pd.array(values).astype(column.dtype)
+    df[rule.column] = column
+    return int((missing & df[rule.column].notna().to_numpy()).sum())
+
+
+def clean_partitioned(df, clean_rows, workers, rules=DEFAULT_RULES, n_partitions=None):
+    """``preprocessing.clean_data`` on ``workers`` processes, one task per partition.
+
+    ``clean_rows`` is the row-local cleaning step (``preprocessing.clean_rows``).
+    """
+    n_partitions = n_partitions or workers
+    local, merged = _local_rules(rules)
+
+    with span("partition"):
+        codes = partition_codes(df, n_partitions)
+        handle, path = tempfile.mkstemp(suffix=".arrow", prefix="vehicles-partitions-", dir=SHM_DIR)
+        os.close(handle)
+    try:
+        order = _write_partitions(df, codes, n_partitions, path)
+        with span("clean_partitions"), ProcessPoolExecutor(workers) as pool:
+            futures = [pool.submit(clean_partition, path, index, clean_rows, rules) for index in range(n_partitions)]
+            results = [future.result() for future in futures]
+    finally:
+        os.remove(path)
+
+    with span("merge_partitions"):
+        # Partitions without rows may lack the categories' value dtype; they add nothing
+        frames = [frame for frame, _, _, _ in results if len(frame)] or [results[0][0]]
+        clean = _concat_partitions(frames).take(np.argsort(order, kind="stable"))
+        clean.index = df.index
+
+        memory = {
+            column: tuple(sum(memory_report[column][i] for _, _, memory_report, _ in results) for i in (0, 1))
+            for column in results[0][2]
+        }
+
+        report = {}
+        if rules and not local and not merged:
+            clean, report = impute(clean, rules)
+        for rule in rules:
+            if rule in local:
+                counts = [partition_report[rule.column] for _, partition_report, _, _ in results
+                          if rule.column in partition_report]
+                if counts:
+                    report[rule.column] = sum(counts)
+            elif rule in merged and rule.column in results[0][3]:
+                report[rule.column] = _impute_merged(clean, rule, [stats[rule.column] for *_, stats in results])
+
+    clean.attrs["memory_report"] = memory
+    clean.attrs["imputation_report"] = report
+    return add_time_buckets(clean)
@@ -0,0 +1,174 @@
+"""Versioned cleaning / imputation stage for the vehicles dataset.
+
+``clean_data`` is the preprocessing that used to run at module level in app.py on
+every rerun. ``load_clean_data`` wraps it with an on-disk cache keyed on the raw
+data hash and ``PIPELINE_VERSION``. Each source of raw data (the downloaded
+snapshot, an upload, a batch export) has its own cache slot. When the data of a
+source changed but its previous cleaned frame was built by the same pipeline
+version from the same raw columns, only the changed listings are reprocessed
+(see incremental.py).
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from data_cache import read_cached_frame, read_meta, store_cached_frame
+from diagnostics import span
+from features import add_time_buckets
+from imputation import impute
+from incremental import apply_changes, build_state, load_state, raw_columns, raw_identity, save_state
+from model_names import parse_models
+from partitions import MIN_PARALLEL_ROWS, clean_partitioned
+from schema import apply_schema
+from sketches import QUANTILE_ENGINE, use_sketches
+
+# Bump this whenever clean_data changes its output, so cached frames are rebuilt
+PIPELINE_VERSION = 8
+
+# Where the raw data came from; each source keeps its own cleaned frame on disk
+SOURCES = ("snapshot", "upload", "export")
+
+# Worker processes for a full rebuild (1 = serial); see partitions.py
+PREPROCESS_WORKERS = int(os.environ.get("PREPROCESS_WORKERS", "1"))
+
+
+def parse_iso_dates(values):
+    """A column of ISO date strings parsed by Arrow, or None if it is not one."""
+    if not pd.api.types.is_string_dtype(values.dtype):
+        return None
+    try:
+        parsed = pc.cast(pa.array(values, from_pandas=True), pa.timestamp("us"))
+    except (pa.ArrowInvalid, pa.ArrowNotImplementedError, pa.ArrowTypeError, TypeError):
+        return None
+    return pd.Series(np.asarray(parsed), index=values.index, name=values.name)
+
+
+def parse_dates(values):
+    """``pd.to_datetime`` for a column of ISO date strings, parsed by Arrow.
+
+    Arrow parses straight from the string buffers, where ``pd.to_datetime``
+    first builds a Python string per row (most of clean_rows' peak memory).
+    Other formats fall back to ``pd.to_datetime``.
+    """
+    parsed = parse_iso_dates(values)
+    return parsed if parsed is not None else pd.to_datetime(values)
+
+
+def clean_rows(df):
+    """Row-local cleaning: split model names, derive date_sold, fill flags, apply the schema.
+
+    Every step here looks at one row at a time, so it can run on any subset of
+    the listings. Group imputation is left to ``clean_data``.
+
+    Columns are only ever replaced or inserted, never written through a chained
+    selection, so nothing here copies the whole frame: with copy-on-write the
+    shallow copy below shares every column with the caller's frame until the
+    column is replaced.
+    """
+    df = df.copy(deep=False)
+
+    # Split the 'model' column into 'make' and 'model_type' (parsed once per distinct model),
+    # inserted right after 'model' instead of reordering (and copying) the frame
+    if "model" in df.columns:
+        make, model_type = parse_models(df["model"])
+        position = df.columns.get_loc("model") + 1
+        df.insert(position, "make", make)
+        df.insert(position + 1, "model_type", model_type)
+
+    if "date_posted" in df.columns:
+        df["date_posted"] = parse_dates(df["date_posted"])
+        df["date_sold"] = df["date_posted"] + pd.to_timedelta(df["days_listed"], unit="D")
+
+    # Assign the filled column back: an inplace fillna on df[...] never reaches df
+    if "is_4wd" in df.columns:
+        df["is_4wd"] = df["is_4wd"].fillna(0)
+
+    if "paint_color" in df.columns:
+        df["paint_color"] = df["paint_color"].fillna("Unknown")
+
+    # Compact dtypes: categoricals for text fields, downcast numerics
+    df, memory = apply_schema(df)
+    df.attrs["memory_report"] = memory
+    return df
+
+
+def clean_data(df, workers=None):
+    """Split model names, derive date_sold, impute missing values and bucket model years.
+
+    With ``workers`` (default: ``PREPROCESS_WORKERS``) above 1, large frames are
+    cleaned partition by partition in a process pool, with the same result.
+    """
+    workers = PREPROCESS_WORKERS if workers is None else workers
+    if workers > 1 and len(df) >= MIN_PARALLEL_ROWS:
+        return clean_partitioned(df, clean_rows, workers)
+
+    with span("clean_rows"):
+        df = clean_rows(df)
+
+    # Fill cylinders and odometer from their group statistics
+    df, report = impute(df)
+    df.attrs["imputation_report"] = report
+
+    # Decade / 5-year / year buckets of model_year, shared by the charts
+    df = add_time_buckets(df)
+
+    return df
+
+
+def pipeline_key(data_hash):
+    """Cache key for the cleaned frame of a given raw dataset."""
+    # Sketch medians give (slightly) different imputed values, so they are cached apart
+    engine = f":{QUANTILE_ENGINE}" if use_sketches() else ""
+    return f"{data_hash}:v{PIPELINE_VERSION}{engine}"
+
+
+def clean_snapshot_name(source="snapshot"):
+    """Name of the on-disk cleaned frame for raw data from ``source``."""
+    if source not in SOURCES:
+        raise ValueError(f"Unknown data source {source!r}, expected one of {', '.join(SOURCES)}")
+    return f"vehicles_clean_{source}"
+
+
+def load_clean_data(df, data_hash, source="snapshot"):
+    """Return the cleaned frame for ``df``, reusing the on-disk copy if present.
+
+    If only an older version of the data from the same ``source`` was cleaned,
+    with the same raw columns, the new frame is derived from it incrementally
+    instead of being rebuilt from scratch.
+    """
+    if data_hash is None:
+        return clean_data(df)
+
+    name = clean_snapshot_name(source)
+    key = pipeline_key(data_hash)
+    cached = read_cached_frame(name, key)
+    if cached is not None:
+        return cached
+
+    previous_key = (read_meta(name) or {}).get("key", "")
+    previous = None
+    state = None
+    # Same pipeline version and quantile engine, other data
+    if previous_key.partition(":")[2] == key.partition(":")[2]:
+        state = load_state(name, previous_key)
+        # Another dataset (other columns or dtypes) is rebuilt from scratch
+        if state is not None and state.get("raw_columns") != raw_columns(df):
+            state = None
+        previous = read_cached_frame(name, previous_key) if state is not None else None
+
+    if previous is not None:
+        with span("incremental_refresh"):
+            df, state, _ = apply_changes(previous, state, df, clean_rows)
+    else:
+        identity = raw_identity(df)
+        df = clean_data(df)
+        state = build_state(identity, df)
+
+    with span("store_clean"):
+        store_cached_frame(name, key, df)
+        save_state(name, key, state)
+    return df
@@ -0,0 +1,66 @@
+"""Compact column dtypes for the vehicles listings frame.
+
+pandas reads the CSV as object strings and float64/int64 numbers. The low
+cardinality text columns become categoricals (groupbys then work on integer codes)
+and the numeric columns are downcast to the smallest dtype that holds them.
+"""
+
+import pandas as pd
+
+# Low-cardinality text fields stored as categoricals
+CATEGORY_COLUMNS = [
+    "model",
+    "make",
+    "model_type",
+    "condition",
+    "fuel",
+    "transmission",
+    "type",
+    "paint_color",
+]
+
+# Numeric fields and their compact dtypes (nullable ints keep missing values)
+NUMERIC_DTYPES = {
+    "model_year": "Int16",
+    "cylinders": "Int16",
+    "days_listed": "Int16",
+    "price": "Int32",
+    "odometer": "float32",
+    "is_4wd": "boolean",
+}
+
+
+def apply_schema(df):
+    """Cast ``df``'s known columns to the compact schema, in place.
+
+    Returns ``(df, report)`` where ``report`` maps each converted column to its
+    ``(bytes_before, bytes_after)`` memory usage.
+    """
+    report = {}
+    dtypes = {column: "category" for column in CATEGORY_COLUMNS}
+    dtypes.update(NUMERIC_DTYPES)
+
+    for column, dtype in dtypes.items():
+        if column not in df.columns:
+            continue
+        before = int(df[column].memory_usage(index=False, deep=True))
+        if dtype in ("Int16", "Int32"):
+            # Round first so float columns with whole values cast safely
+            df[column] = pd.to_numeric(df[column]).round().astype(dtype)
+        else:
+            df[column] = df[column].astype(dtype)
+        after = int(df[column].memory_usage(index=False, deep=True))
+        report[column] = (before, after)
+
+    return df, report
+
+
+def memory_report(report):
+    """Format an ``apply_schema`` report as a table in megabytes."""
+    table = pd.DataFrame.from_dict(
+        report, orient="index", columns=["before_mb", "after_mb"]
+    ) / 1e6
+    if not table.empty:
+        table.loc["total"] = table.sum()
+    table["saved_pct"] = (1 - table["after_mb"] / table["before_mb"]) * 100
+    return table.round(2)
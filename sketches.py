@@ -0,0 +1,154 @@
+"""Mergeable per-group quantile sketches (t-digest style).
+
+An exact median needs every value of a group and a sort, and it cannot be
+updated from a delta or combined across partitions. A sketch keeps each group
+as a bounded set of weighted centroids ``(mean, weight)``. Groups are held side
+by side in one frame: the group key columns plus ``mean`` and ``weight``.
+
+Centroids are merged along the t-digest ``k1`` scale function, so there are
+small centroids near the tails, larger ones near the median, and at most about
+``compression / 2`` per group. Two sketch frames are combined by concatenating
+them and compressing again. Quantiles interpolate between centroid centres.
+Groups of up to ``EXACT_GROUP_SIZE`` values keep every value as its own
+centroid, so their quantiles are exact (the same as ``DataFrame.quantile``).
+Just above the centroid budget the sketch error is largest (several percent of
+the value), so small groups are not compressed at all.
+
+``QUANTILE_ENGINE`` (env var, ``"exact"`` by default) selects the engine used
+for medians by imputation, the aggregate store and the quantile strips.
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+
+# "exact" (full sort per group) or "sketch" (mergeable centroids)
+QUANTILE_ENGINE = os.environ.get("QUANTILE_ENGINE", "exact")
+
+# Centroid budget per group (t-digest delta); higher is more accurate and larger
+COMPRESSION = 200
+
+# Groups with at most this many values are kept whole (exact quantiles)
+EXACT_GROUP_SIZE = 1000
+
+
+def use_sketches(engine=None):
+    """Whether ``engine`` (default: ``QUANTILE_ENGINE``) is the sketch engine."""
+    return (engine or QUANTILE_ENGINE) == "sketch"
+
+
+def _group_codes(frame, by):
+    return frame.groupby(list(by), observed=True, dropna=False, sort=False).ngroup().to_numpy()
+
+
+def compress(centroids, by, compression=COMPRESSION):
+    """Merge the centroids of each ``by`` group along the k1 scale."""
+    if centroids.empty:
+        return centroids[list(by) + ["mean", "weight"]].reset_index(drop=True)
+
+    groups = _group_codes(centroids, by)
+    means = centroids["mean"].to_numpy(dtype="float64")
+    weights = centroids["weight"].to_numpy(dtype="float64")
+    order = np.lexsort((means, groups))
+    groups, means, weights = groups[order], means[order], weights[order]
+
+    # Cumulative weight within each group, at the centre of each centroid
+    cumulative = np.cumsum(weights)
+    starts = np.flatnonzero(np.r_[True, groups[1:] != groups[:-1]])
+    lengths = np.diff(np.r_[starts, len(groups)])
+    before = np.repeat(cumulative[starts] - weights[starts], lengths)
+    totals = np.repeat(np.add.reduceat(weights, starts), lengths)
+    q = (cumulative - before - weights / 2) / totals
+
+    # k1 scale: centroid k covers one unit of compression / (2 pi) * asin(2q - 1)
+    k = np.floor(compression / (2 * np.pi) * np.arcsin(np.clip(2 * q - 1, -1, 1))).astype("int64")
+    # Small groups keep every centroid, so their quantiles stay exact
+    small = totals <= max(EXACT_GROUP_SIZE, compression / 2)
+    k[small] = (np.arange(len(groups)) - np.repeat(starts, lengths))[small]
+
+    merged = pd.DataFrame({
+        "group": groups,
+        "k": k,
+        "weighted": means * weights,
+        "weight": weights,
+        "position": order,
+    }).groupby(["group", "k"], sort=True).agg(
+        weighted=("weighted", "sum"), weight=("weight", "sum"), position=("position", "first")
+    )
+    keys = centroids[list(by)].iloc[merged["position"].to_numpy()].reset_index(drop=True)
+    return keys.assign(
+        mean=(merged["weighted"] / merged["weight"]).to_numpy(),
+        weight=merged["weight"].to_numpy(),
+    )
+
+
+def build_sketches(df, by, column, compression=COMPRESSION, dropna=True):
+    """Sketch of ``column`` for every ``by`` group of ``df``.
+
+    Missing values are skipped; with ``dropna`` so are rows with a missing key.
+    """
+    frame = df[list(by) + [column]]
+    present = frame[column].notna()
+    if dropna:
+        present &= frame[list(by)].notna().all(axis=1)
+    frame = frame[present]
+    centroids = frame[list(by)].assign(mean=frame[column].to_numpy(dtype="float64"), weight=1.0)
+    return compress(centroids, by, compression)
+
+
+def merge_sketches(sketches, by, compression=COMPRESSION):
+    """Combine sketch frames (e.g. of different partitions) into one."""
+    sketches = [sketch for sketch in sketches if len(sketch)]
+    if not sketches:
+        return compress(pd.DataFrame(columns=list(by) + ["mean", "weight"]), by, compression)
+    return compress(pd.concat(sketches, ignore_index=True), by, compression)
+
+
+def sketch_quantile(sketches, by, q):
+    """The ``q`` quantile of each group: a frame of the ``by`` keys and ``value``."""
+    by = list(by)
+    if sketches.empty:
+        return sketches[by].assign(value=pd.Series(dtype="float64"))
+
+    # compress() leaves centroids sorted by group, then mean
+    groups = _group_codes(sketches, by)
+    means = sketches["mean"].to_numpy(dtype="float64")
+    weights = sketches["weight"].to_numpy(dtype="float64")
+    starts = np.flatnonzero(np.r_[True, groups[1:] != groups[:-1]])
+    lengths = np.diff(np.r_[starts, len(groups)])
+    cumulative = np.cumsum(weights)
+    before = np.repeat(cumulative[starts] - weights[starts], lengths)
+    totals = np.repeat(np.add.reduceat(weights, starts), lengths)
+
+    # Centroid centres on one increasing axis: group index + position within the group.
+    # A centroid sits at the middle of the ranks it covers, over (total - 1) like
+    # pandas' linear quantiles, so groups kept whole give exactly DataFrame.quantile
+    group_index = np.repeat(np.arange(len(starts)), lengths)
+    ranks = cumulative - before - weights + (weights - 1) / 2
+    centres = group_index + ranks / np.maximum(totals - 1, 1)
+    targets = np.arange(len(starts)) + q
+
+    last = starts + lengths - 1
+    left = np.searchsorted(centres, targets, side="right") - 1
+    left = np.clip(left, starts, last)  # outside the centres: clamp to the group's ends
+    right = np.minimum(left + 1, last)
+    span = centres[right] - centres[left]
+    fraction = np.where(span > 0, (targets - centres[left]) / np.where(span > 0, span, 1), 0.0)
+    fraction = np.clip(fraction, 0.0, 1.0)
+    values = means[left] + fraction * (means[right] - means[left])
+
+    return sketches[by].iloc[starts].reset_index(drop=True).assign(value=values)
+
+
+def group_quantile(df, by, column, q=0.5, dropna=True, compression=COMPRESSION):
+    """Sketch-based ``q`` quantile of ``column`` per ``by`` group, broadcast to the rows.
+
+    The sketch counterpart of ``groupby(by)[column].transform("median")``.
+    """
+    codes = df.groupby(list(by), observed=True, dropna=dropna, sort=False).ngroup().to_numpy()
+    frame = pd.DataFrame({"group": codes, "value": df[column].to_numpy(dtype="float64", na_value=np.nan)})
+    frame = frame[frame["group"] >= 0]
+    sketches = build_sketches(frame, ["group"], "value", compression)
+    quantiles = sketch_quantile(sketches, ["group"], q).set_index("group")["value"]
+    return pd.Series(quantiles.reindex(codes).to_numpy(), index=df.index, name=column)
@@ -0,0 +1,92 @@
+"""Seaborn/matplotlib charts rendered to PNG bytes.
+
+These charts are drawn on explicit ``matplotlib.figure.Figure`` objects instead of
+the global ``pyplot`` state, so nothing is left registered with pyplot between
+reruns and concurrent sessions cannot draw onto each other's figures. The caller
+caches the returned PNG bytes, so each chart is rasterized once per dataset.
+"""
+
+import io
+
+import numpy as np
+import seaborn as sns
+from matplotlib.figure import Figure
+
+
+def render_png(fig):
+    """Rasterize ``fig`` to PNG bytes."""
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format="png", bbox_inches="tight")
+    return buffer.getvalue()
+
+
+def days_listed_by_brand_png(fastest_selling_brands):
+    """Bar chart of average days listed per make, sorted fastest first."""
+    # Plain strings, so bars follow the row order rather than the category order
+    fastest_selling_brands = fastest_selling_brands.astype({"make": str})
+
+    fig = Figure(figsize=(12, 6))
+    ax = fig.subplots()
+    sns.barplot(
+        data=fastest_selling_brands,
+        x="make",
+        y="days_listed",
+        palette="coolwarm",
+        ax=ax,
+    )
+
+    # Highlight the fastest selling brand (if any)
+    if len(fastest_selling_brands):
+        fastest_brand = fastest_selling_brands.iloc[0]
+        ax.text(
+            0.1,
+            fastest_brand["days_listed"] + 0.5,
+            f"{fastest_brand['days_listed']:.1f} days",
+            ha="center",
+            fontsize=10,
+            color="red",
+            rotation=0,
+        )
+
+    # Customize the plot
+    ax.set_title("Fastest Selling Car Brands", fontsize=16)
+    ax.set_xlabel("Car Brand", fontsize=14)
+    ax.set_ylabel("Average Days Listed", fontsize=14)
+    ax.tick_params(axis="x", labelsize=9, rotation=90)
+    ax.tick_params(axis="y", labelsize=10)
+    ax.spines["top"].set_visible(False)
+    ax.spines["right"].set_visible(False)
+    ax.grid(axis="y", linestyle="--", alpha=0.7)
+
+    fig.tight_layout()
+    return render_png(fig)
+
+
+def price_histogram_png(df):
+    """Histogram of listing prices."""
+    fig = Figure(figsize=(12, 5))
+    ax = fig.subplots()
+    sns.histplot(data=df, x="price", bins=50, ax=ax)
+    ax.set_title("Price Distribution")
+    ax.set_xlabel("Price (USD)", fontsize=10)
+    ax.set_ylabel("Count of Cars on Sale", fontsize=10)
+    ax.grid(axis="y", linestyle="--", alpha=0.7)
+    ax.spines["top"].set_visible(False)
+    ax.spines["right"].set_visible(False)
+    return render_png(fig)
+
+
+def days_listed_histogram_png(df):
+    """Histogram of days listed, segmented by condition."""
+    fig = Figure(figsize=(12, 5))
+    ax = fig.subplots()
+    # seaborn cannot split an empty frame by hue; it then draws empty axes
+    hue = "condition" if len(df) else None
+    sns.histplot(data=df, x="days_listed", hue=hue, bins=np.arange(0, 300, 10),
+                 palette="viridis" if hue else None, ax=ax)
+    ax.set_title("Vehicle Listing Days Distribution")
+    ax.grid(axis="y", linestyle="--", alpha=0.7)
+    ax.set_xticks(np.arange(0, 300, 20))
+    ax.set_xlabel("Days Listed")
+    ax.set_ylabel("# of Vehicles Listed for Sale")
+    return render_png(fig)
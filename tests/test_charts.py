@@ -0,0 +1,57 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from charts import bar_totals, box_figure, box_stats, histogram_counts, quantile_strip
+
+
+@pytest.fixture
+def empty_frame():
+    return pd.DataFrame({
+        "odometer": pd.Series(dtype="float64"),
+        "condition": pd.Categorical([], categories=["good", "fair"]),
+    })
+
+
+@pytest.mark.parametrize("by", [None, "condition"])
+def test_histogram_counts_of_no_rows_is_empty(empty_frame, by):
+    counts = histogram_counts(empty_frame, "odometer", by=by)
+    assert counts.empty
+    assert {"bin_start", "bin_end", "bin_mid", "count"} <= set(counts.columns)
+
+
+@pytest.mark.parametrize("engine", ["exact", "sketch"])
+@pytest.mark.parametrize("by", [None, "condition"])
+def test_quantile_strip_of_no_rows_is_empty(empty_frame, by, engine):
+    assert quantile_strip(empty_frame, "odometer", by=by, engine=engine).empty
+
+
+def test_histogram_counts_share_edges_across_groups():
+    df = pd.DataFrame({"odometer": np.arange(100.0), "condition": ["good", "fair"] * 50})
+    counts = histogram_counts(df, "odometer", by="condition", bins=10)
+    assert counts.groupby("condition")["count"].sum().to_dict() == {"fair": 50, "good": 50}
+    assert counts.groupby("condition")["bin_start"].apply(tuple).nunique() == 1
+
+
+def test_bar_totals_with_the_same_column_for_x_and_y():
+    df = pd.DataFrame({"price": [1.0, 1.0, 2.0]})
+    totals = bar_totals(df, "price", "price")
+    assert totals.columns.tolist() == ["price", "price (sum)"]
+    assert totals["price (sum)"].tolist() == [2.0, 2.0]
+
+
+def test_box_stats_grouped_by_its_own_column():
+    df = pd.DataFrame({"price": [1.0, 1.0, 2.0, 50.0]})
+    stats, outliers = box_stats(df, "price", by="price")
+    assert stats["price"].tolist() == [1.0, 2.0, 50.0]
+    assert stats["count"].tolist() == [2, 1, 1]
+    box_figure(stats, outliers, "price", "price")
+
+
+@pytest.mark.parametrize("by", [None, "condition"])
+def test_box_stats_without_values_draw_an_empty_figure(empty_frame, by):
+    for df in (empty_frame, pd.DataFrame({"odometer": [np.nan, np.nan], "condition": ["good", "fair"]})):
+        stats, outliers = box_stats(df, "odometer", by=by)
+        assert stats.empty and outliers.empty
+        assert "median" in stats.columns
+        box_figure(stats, outliers, "odometer", by)
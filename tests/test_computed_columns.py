@@ -0,0 +1,56 @@
+import time
+
+import pandas as pd
+import pytest
+
+from computed_columns import ComputedColumns, ExpressionError, evaluate
+
+
+@pytest.fixture
+def listings():
+    return pd.DataFrame({
+        "price": [10_000.0, 20_000.0, 5_000.0],
+        "odometer": [100_000.0, 50_000.0, 0.0],
+        "date_posted": pd.array(["2019-01-01", "2019-02-01", "2019-03-01"], dtype="str"),
+        "days_listed": [10, 20, 30],
+    })
+
+
+def test_arithmetic_and_dates(listings):
+    assert evaluate(listings, "price / 1000").tolist() == [10.0, 20.0, 5.0]
+    sold = evaluate(listings, "date_posted + days_listed")
+    assert sold.tolist() == list(pd.to_datetime(["2019-01-11", "2019-02-21", "2019-03-31"]))
+
+
+@pytest.mark.parametrize("expression", [
+    "__import__('os')", "price.__class__", "listings['price']", "unknown + 1", "lambda: 1",
+])
+def test_rejects_unsafe_expressions(listings, expression):
+    with pytest.raises(ExpressionError):
+        evaluate(listings, expression)
+
+
+def test_small_powers_are_allowed(listings):
+    assert evaluate(listings, "price ** 2").tolist() == [1e8, 4e8, 2.5e7]
+    assert evaluate(listings, "price ** -0.5").iloc[0] == pytest.approx(0.01)
+
+
+@pytest.mark.parametrize("expression", ["price + 9**9**8", "price ** price", "(price ** 2) ** 2", "price + 2 ** 1000"])
+def test_large_powers_are_rejected_quickly(listings, expression):
+    start = time.perf_counter()
+    with pytest.raises(ExpressionError):
+        evaluate(listings, expression)
+    assert time.perf_counter() - start < 1
+
+
+def test_editing_a_column_recomputes_its_dependents(listings):
+    computed = ComputedColumns()
+    computed.define("ppm", "price / odometer", listings.columns)
+    computed.define("ppm2", "ppm * 2", listings.columns)
+    computed.define("other", "price + 1", listings.columns)
+    _, recomputed = computed.apply(listings, "v1")
+    assert sorted(recomputed) == ["other", "ppm", "ppm2"]
+
+    computed.define("ppm", "price / (odometer + 1)", listings.columns)
+    _, recomputed = computed.apply(listings, "v1")
+    assert sorted(recomputed) == ["ppm", "ppm2"]
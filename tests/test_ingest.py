@@ -0,0 +1,60 @@
+import io
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import data_cache
+import ingest
+from ingest import ingest_csv, read_ingested
+
+
+@pytest.fixture(autouse=True)
+def snapshot_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(ingest, "SNAPSHOT_DIR", str(tmp_path))
+    monkeypatch.setattr(data_cache, "SNAPSHOT_DIR", str(tmp_path))
+
+
+def _ingest(data, **kwargs):
+    name, _ = ingest_csv(io.BytesIO(data), **kwargs)
+    return read_ingested(name)
+
+
+def test_null_counts_match_read_csv():
+    rng = np.random.default_rng(0)
+    n = 5_000
+    frame = pd.DataFrame({
+        "price": rng.integers(1_000, 50_000, n).astype(float),
+        "paint_color": rng.choice(["red", "blue", "white"], n).astype(object),
+        "model": rng.choice(["ford f-150", "bmw x5"], n).astype(object),
+    })
+    frame.loc[rng.random(n) < 0.1, "price"] = np.nan
+    frame.loc[rng.random(n) < 0.1, "paint_color"] = np.nan
+    frame.loc[::97, "model"] = "NA"
+    data = frame.to_csv(index=False).encode()
+    data = data.replace(b",blue,", b',"",', 5)
+
+    ingested = _ingest(data, block_size=16 * 1024)
+    expected = pd.read_csv(io.BytesIO(data))
+    assert ingested.isna().sum().to_dict() == expected.isna().sum().to_dict()
+
+
+def test_widens_columns_the_sample_got_wrong():
+    rows = 300
+    data = (
+        "a,b,c\n"
+        + "".join(f"{i},,{i}\n" for i in range(rows))
+        + "n/a?,text,2.5\n"
+    ).encode()
+
+    ingested = _ingest(data, block_size=1024, sample_rows=100)
+    expected = pd.read_csv(io.BytesIO(data))
+    assert ingested.dtypes.astype(str).tolist() == expected.dtypes.astype(str).tolist()
+    assert ingested.iloc[-1].tolist() == expected.iloc[-1].tolist()
+
+
+def test_keeps_int64_without_missing_values():
+    data = "a,b\n" + "".join(f"{i},{i}.5\n" for i in range(100))
+    ingested = _ingest(data.encode())
+    assert ingested["a"].dtype == "int64"
+    assert ingested["b"].dtype == "float64"
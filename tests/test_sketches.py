@@ -0,0 +1,26 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from sketches import EXACT_GROUP_SIZE, build_sketches, merge_sketches, sketch_quantile
+
+
+def _quantile(values, q, parts=1):
+    frames = [pd.DataFrame({"group": 0, "value": part}) for part in np.array_split(values, parts)]
+    sketches = merge_sketches([build_sketches(frame, ["group"], "value") for frame in frames], ["group"])
+    return sketch_quantile(sketches, ["group"], q)["value"].iloc[0]
+
+
+@pytest.mark.parametrize("size", [101, 150, EXACT_GROUP_SIZE])
+def test_small_groups_are_exact(size):
+    values = np.random.default_rng(size).lognormal(9.5, 0.8, size)
+    for q in (0.25, 0.5, 0.75):
+        assert _quantile(values, q, parts=3) == pytest.approx(np.quantile(values, q))
+
+
+@pytest.mark.parametrize("size", [EXACT_GROUP_SIZE + 1, 5_000, 50_000])
+def test_large_groups_stay_within_half_a_percent_of_rank(size):
+    values = np.random.default_rng(size).lognormal(9.5, 0.8, size)
+    for q in (0.01, 0.5, 0.99):
+        estimate = _quantile(values, q, parts=4)
+        assert abs((values <= estimate).mean() - q) <= 0.005
@@ -0,0 +1,157 @@
+"""Shared cache of parsed uploads, keyed on the file's content hash.
+
+Streamlit reruns the whole script on every widget change, and every session that
+uploads the same export would otherwise parse it again. ``UploadCache`` keeps
+parsed frames in memory up to a byte budget (least recently used first out) and
+falls back to the Parquet files written by ``ingest.ingest_csv``, which double
+as the disk spill. Entries older than the TTL are dropped from both tiers.
+
+Frames returned by the cache are shared between sessions and must be treated as
+read-only.
+"""
+
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from data_cache import SNAPSHOT_DIR
+from diagnostics import record_miss, span
+from ingest import ingest_csv, read_ingested, snapshot_name
+
+# In-memory budget for parsed uploads
+MAX_MEMORY_BYTES = int(os.environ.get("UPLOAD_CACHE_MEMORY_MB", "512")) * 1024 * 1024
+
+# On-disk budget for ingested uploads
+MAX_DISK_BYTES = int(os.environ.get("UPLOAD_CACHE_DISK_MB", "4096")) * 1024 * 1024
+
+# Seconds an upload stays cached after it was last parsed
+TTL = int(os.environ.get("UPLOAD_CACHE_TTL_SECONDS", str(6 * 3600)))
+
+PREFIX = "upload"
+
+
+def fingerprint(uploaded_file, known=None):
+    """sha256 of an uploaded file's content, without copying its buffer.
+
+    ``known`` (e.g. a dict in ``st.session_state``) maps the ``file_id`` of files
+    hashed before to their hash, so a rerun does not hash the same upload again.
+    """
+    file_id = getattr(uploaded_file, "file_id", None)
+    if known is not None and file_id is not None and file_id in known:
+        return known[file_id]
+    content_hash = hashlib.sha256(uploaded_file.getbuffer()).hexdigest()
+    if known is not None and file_id is not None:
+        known[file_id] = content_hash
+    return content_hash
+
+
+class UploadCache:
+    """Memory + disk cache of parsed uploads, safe to share across sessions."""
+
+    def __init__(self, max_memory_bytes=MAX_MEMORY_BYTES, max_disk_bytes=MAX_DISK_BYTES, ttl=TTL):
+        self.max_memory_bytes = max_memory_bytes
+        self.max_disk_bytes = max_disk_bytes
+        self.ttl = ttl
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        # content hash -> (df, nbytes, created_at)
+        self._entries = OrderedDict()
+        self._memory_bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, uploaded_file, progress=None, known_hashes=None):
+        """Return ``(df, content_hash)`` for ``uploaded_file``, parsing it at most once.
+
+        ``progress`` is only called when the file is parsed; ``known_hashes`` is
+        passed to ``fingerprint``.
+        """
+        content_hash = fingerprint(uploaded_file, known_hashes)
+
+        with self._lock:
+            entry = self._entries.get(content_hash)
+            if entry is not None and time.time() - entry[2] < self.ttl:
+                self._entries.move_to_end(content_hash)
+                self.hits += 1
+                return entry[0], content_hash
+            if entry is not None:
+                self._drop(content_hash)
+
+        name = snapshot_name(PREFIX, content_hash)
+        path = os.path.join(SNAPSHOT_DIR, f"{name}.parquet")
+        if os.path.exists(path) and time.time() - os.path.getmtime(path) < self.ttl:
+            # Spilled to disk earlier (or parsed by another worker process)
+            with span("read_parquet"):
+                df = read_ingested(name)
+            created_at = os.path.getmtime(path)
+            with self._lock:
+                self.disk_hits += 1
+        else:
+            record_miss("upload_cache")
+            uploaded_file.seek(0)
+            with span("ingest_csv"):
+                name, content_hash = ingest_csv(uploaded_file, PREFIX, progress=progress)
+            with span("read_parquet"):
+                df = read_ingested(name)
+            created_at = time.time()
+            with self._lock:
+                self.misses += 1
+            self._prune_disk()
+
+        with self._lock:
+            self._put(content_hash, df, created_at)
+        return df, content_hash
+
+    def _put(self, content_hash, df, created_at):
+        if content_hash in self._entries:
+            self._drop(content_hash)
+        nbytes = int(df.memory_usage(index=True, deep=True).sum())
+        if nbytes > self.max_memory_bytes:
+            # Too big for the memory tier; it stays on disk only
+            return
+        self._entries[content_hash] = (df, nbytes, created_at)
+        self._memory_bytes += nbytes
+        while self._memory_bytes > self.max_memory_bytes:
+            oldest = next(iter(self._entries))
+            self._drop(oldest)
+
+    def _drop(self, content_hash):
+        _, nbytes, _ = self._entries.pop(content_hash)
+        self._memory_bytes -= nbytes
+
+    def _prune_disk(self):
+        """Delete expired uploads, then the oldest ones until under the disk budget."""
+        try:
+            files = [
+                os.path.join(SNAPSHOT_DIR, filename)
+                for filename in os.listdir(SNAPSHOT_DIR)
+                if filename.startswith(PREFIX + "_") and filename.endswith(".parquet")
+            ]
+        except OSError:
+            return
+
+        now = time.time()
+        files = sorted(files, key=os.path.getmtime)
+        total = sum(os.path.getsize(path) for path in files)
+        for path in files:
+            if now - os.path.getmtime(path) < self.ttl and total <= self.max_disk_bytes:
+                continue
+            size = os.path.getsize(path)
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+
+    def stats(self):
+        """Counters for the diagnostics panel."""
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "memory_mb": round(self._memory_bytes / 1e6, 1),
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+            }